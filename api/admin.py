@@ -6,3 +6,16 @@ from api import models
 
 admin.site.register(models.User)
 admin.site.register(models.Product)
+admin.site.register(models.ArchivedProduct)
+admin.site.register(models.Notification)
+admin.site.register(models.Conversation)
+admin.site.register(models.Message)
+admin.site.register(models.FlashSale)
+
+
+@admin.register(models.OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    # queued bodies hold one time codes, staff see who and when, not what
+    exclude = ('body', 'html_body')
+    list_display = ('to', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
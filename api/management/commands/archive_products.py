@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api.utils.archive import archivable_products, archive_products
+
+
+class Command(BaseCommand):
+    help = ('Move inactive and long unchanged products out of the live product table into the archive, '
+            'a batch per transaction')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Defaults to PRODUCT_ARCHIVE_BATCH_SIZE')
+        parser.add_argument('--inactive-days', type=int, help='Defaults to PRODUCT_ARCHIVE_INACTIVE_DAYS')
+        parser.add_argument('--max-age-days', type=int, help='Defaults to PRODUCT_ARCHIVE_MAX_AGE_DAYS')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the products due')
+
+    def handle(self, *args, **options):
+        cutoffs = {
+            'inactive_days': options['inactive_days'],
+            'max_age_days': options['max_age_days'],
+        }
+        if options['dry_run']:
+            due = archivable_products(**cutoffs).count()
+            self.stdout.write(f'{due} products are due for the archive')
+            return
+
+        archived = archive_products(batch_size=options['batch_size'], **cutoffs)
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} products'))
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections, transaction
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from api import models
+from api.utils import flash_sales
+
+
+def naive_reserve(sale_id, user_id, quantity=1):
+    # read-modify-write, what reserve() replaces, kept to show the overselling
+    with transaction.atomic():
+        sale = models.FlashSale.objects.get(pk=sale_id)
+        if sale.stock < quantity:
+            raise flash_sales.SaleUnavailable()
+        sale.stock -= quantity
+        sale.save(update_fields=['stock'])
+        now = timezone.now()
+        return models.StockReservation.objects.create(
+            sale_id=sale_id, user_id=user_id, quantity=quantity, created_at=now,
+            expires_at=now + flash_sales.get_reservation_ttl())
+
+
+class Command(BaseCommand):
+    help = ('Hammer one flash sale item from many threads and check that no more units are '
+            'reserved than there were, run it against each database backend')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--per-thread', type=int, default=20, help='Reservation attempts per thread')
+        parser.add_argument('--stock', type=int, default=100)
+        parser.add_argument('--strategy', choices=['conditional', 'naive'], default='conditional')
+        parser.add_argument('--keep', action='store_true', help='Keep the created rows')
+
+    def handle(self, *args, **options):
+        suffix = get_random_string(8)
+        attempts = options['threads'] * options['per_thread']
+        owner = models.User.objects.create_user(
+            email=f'flash-{suffix}@example.invalid', password=f'flash{suffix}1')
+        # every attempt is a different buyer, one reservation per buyer and sale is allowed
+        buyers = models.User.objects.bulk_create([
+            models.User(email=f'flash-{suffix}-{n}@example.invalid', password='!')
+            for n in range(attempts)
+        ])
+        category = models.Category.objects.create(name=f'flash-{suffix}')
+        location = models.Location.objects.create(state=f'flash-{suffix}')
+        product = models.Product.objects.create(
+            user=owner, category=category, location=location, name=f'flash {suffix}',
+            description='flash sale benchmark', product_type='declutter', price=1000)
+        now = timezone.now()
+        sale = models.FlashSale.objects.create(
+            product=product, price=500, quantity=options['stock'],
+            starts_at=now - timedelta(minutes=1), ends_at=now + timedelta(hours=1))
+
+        reserve = flash_sales.reserve if options['strategy'] == 'conditional' else naive_reserve
+        outcomes = Counter()
+        errors = []
+        lock = threading.Lock()
+        start = threading.Barrier(options['threads'])
+        latencies = []
+
+        def worker(number):
+            local = Counter()
+            timings = []
+            try:
+                start.wait()
+                for buyer in buyers[number::options['threads']]:
+                    began = time.perf_counter()
+                    try:
+                        reserve(sale.pk, buyer.pk)
+                        local['reserved'] += 1
+                    except flash_sales.SaleUnavailable:
+                        local['sold out'] += 1
+                    except DatabaseError as e:
+                        local['database errors'] += 1
+                        with lock:
+                            if len(errors) < 5:
+                                errors.append(f'thread {number}: {e!r}')
+                    timings.append(time.perf_counter() - began)
+            finally:
+                connections['default'].close()
+                with lock:
+                    outcomes.update(local)
+                    latencies.extend(timings)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(options['threads'])]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        sale.refresh_from_db()
+        reserved = models.StockReservation.objects.filter(sale=sale).count()
+        oversold = reserved - options['stock']
+        latencies.sort()
+
+        self.stdout.write(
+            f'{connection.vendor}, {options["strategy"]}: {attempts} attempts from {options["threads"]} threads '
+            f'in {elapsed:.2f}s ({attempts / elapsed:.0f}/s)')
+        for outcome, count in sorted(outcomes.items()):
+            self.stdout.write(f'  {outcome}: {count}')
+        if latencies:
+            self.stdout.write(
+                f'  latency p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, '
+                f'p99 {latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000:.1f}ms')
+        self.stdout.write(f'  {reserved} reservations for {options["stock"]} units, {sale.stock} left in stock')
+        for error in errors:
+            self.stdout.write(self.style.WARNING(error))
+
+        if not options['keep']:
+            models.User.objects.filter(pk__in=[buyer.pk for buyer in buyers]).delete()
+            owner.delete()
+            category.delete()
+            location.delete()
+
+        if oversold > 0 or reserved + sale.stock != options['stock']:
+            raise CommandError(f'oversold by {max(oversold, 0)}, stock and reservations do not add up')
+        self.stdout.write(self.style.SUCCESS('no overselling'))
@@ -0,0 +1,87 @@
+import gzip
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.crypto import get_random_string
+from rest_framework.renderers import JSONRenderer
+
+from api import models
+from api.serializers import ProductSerializer
+from api.utils import compression
+from api.utils.renderers import FastJSONRenderer, orjson
+
+
+class Rollback(Exception):
+    pass
+
+
+def timed(func, repeat):
+    began = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - began) / repeat * 1000, result
+
+
+class Command(BaseCommand):
+    help = ('Time serializing and rendering a page of products and report the bytes '
+            'sent for each response encoding')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['page_size'], options['repeat'])
+                # nothing created here is kept
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, page_size, repeat):
+        suffix = get_random_string(8)
+        user = models.User.objects.create_user(
+            email=f'bench-{suffix}@example.invalid', password=f'bench{suffix}1')
+        category = models.Category.objects.create(name=f'bench-{suffix}')
+        location = models.Location.objects.create(state=f'bench-{suffix}')
+        models.Product.objects.bulk_create([
+            models.Product(
+                user=user, category=category, location=location, name=f'Bench product {index}',
+                description='Fairly used, clean and working. ' * 8, price=index * 1500,
+                exchange='laptop or phone', product_type='barter',
+                image_renditions={'thumb': {'webp': f'images/renditions/product/{index}/thumb.webp'}})
+            for index in range(page_size)
+        ])
+        products = list(models.Product.objects.filter(category=category))
+
+        serialize_ms, results = timed(lambda: ProductSerializer(products, many=True).data, repeat)
+        page = {'count': len(results), 'next': None, 'previous': None, 'results': results}
+
+        self.stdout.write(f'{len(products)} products, average of {repeat} runs')
+        self.stdout.write(f'  serializer .data         {serialize_ms:8.2f} ms')
+
+        renderers = [('stdlib JSONRenderer', JSONRenderer())]
+        if orjson is not None:
+            renderers.append(('orjson FastJSONRenderer', FastJSONRenderer()))
+        else:
+            self.stdout.write(self.style.WARNING('  orjson is not installed, FastJSONRenderer uses the stdlib'))
+        body = None
+        for name, renderer in renderers:
+            render_ms, body = timed(lambda: renderer.render(page, 'application/json'), repeat)
+            self.stdout.write(f'  {name:<24} {render_ms:8.2f} ms')
+        # both renderers must produce the same document
+        if len(renderers) > 1:
+            assert json.loads(renderers[0][1].render(page)) == json.loads(body)
+
+        self.stdout.write('bytes on the wire')
+        self.stdout.write(f'  identity                 {len(body):8d}')
+        gzip_ms, gzipped = timed(lambda: gzip.compress(body, compresslevel=6, mtime=0), repeat)
+        self.stdout.write(f'  gzip                     {len(gzipped):8d}  ({gzip_ms:.2f} ms)')
+        if compression.brotli is not None:
+            br_ms, compressed = timed(lambda: compression.compress(body, 'br'), repeat)
+            self.stdout.write(f'  br                       {len(compressed):8d}  ({br_ms:.2f} ms)')
+        else:
+            self.stdout.write(self.style.WARNING('  brotli is not installed, only gzip is offered'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utils.schema import clear_schema_artifact, generate_schema, get_schema_path
+
+
+class Command(BaseCommand):
+    help = 'Generate the OpenAPI schema served at /api/v1/schema/ and write it to the versioned artifact'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Fail if the artifact is missing or out of date instead of writing it')
+
+    def handle(self, *args, **options):
+        path = get_schema_path()
+        content = generate_schema()
+
+        if options['check']:
+            if not path.exists() or path.read_bytes() != content:
+                raise CommandError(f'{path} is out of date, run manage.py build_schema')
+            self.stdout.write(self.style.SUCCESS(f'{path} is up to date'))
+            return
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        clear_schema_artifact()
+        self.stdout.write(self.style.SUCCESS(f'Wrote {path} ({len(content)} bytes)'))
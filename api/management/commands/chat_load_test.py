@@ -0,0 +1,166 @@
+import asyncio
+import json
+import statistics
+import time
+import tracemalloc
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.crypto import get_random_string
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import models
+from api.utils.chat import CHAT_PATH, get_channel_layer, send_message, websocket_application
+
+
+class FakeSocket:
+    """
+    Drives the ASGI websocket application the way a server would, without
+    the network, so only the application's own cost is measured.
+    """
+
+    def __init__(self, token):
+        self.scope = {
+            'type': 'websocket', 'path': CHAT_PATH, 'headers': [],
+            'query_string': f'token={token}'.encode(),
+        }
+        self.incoming = asyncio.Queue()
+        self.accepted = asyncio.Event()
+        self.closed = False
+        self.on_message = None
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def send(self, event):
+        if event['type'] == 'websocket.accept':
+            self.accepted.set()
+        elif event['type'] == 'websocket.close':
+            self.closed = True
+            self.accepted.set()
+        elif event['type'] == 'websocket.send':
+            data = json.loads(event['text'])
+            if self.on_message is not None:
+                self.on_message(data)
+
+    def run(self):
+        self.incoming.put_nowait({'type': 'websocket.connect'})
+        return asyncio.create_task(websocket_application(self.scope, self.receive, self.send))
+
+    def disconnect(self):
+        self.incoming.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Hold many idle chat websockets in this process, then measure the memory per '
+            'socket and how long a message takes to reach every socket of both users')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=50, help='Sockets are spread over this many users')
+        parser.add_argument('--messages', type=int, default=50)
+        parser.add_argument('--idle', type=float, default=5, help='Seconds the sockets are held idle')
+        parser.add_argument('--keep', action='store_true', help='Keep the created rows')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2:
+            raise CommandError('--users must be at least 2')
+
+        suffix = get_random_string(8)
+        users = [
+            models.User.objects.create_user(
+                email=f'chat-{suffix}-{n}@example.invalid', password=f'chat{suffix}1', email_confirmed=True)
+            for n in range(options['users'])
+        ]
+        category = models.Category.objects.create(name=f'chat-{suffix}')
+        location = models.Location.objects.create(state=f'chat-{suffix}')
+        seller = users[0]
+        product = models.Product.objects.create(
+            user=seller, category=category, location=location, name=f'chat {suffix}',
+            description='chat load test', product_type='declutter')
+        conversations = [
+            models.Conversation.objects.create(product=product, buyer=buyer, seller=seller)
+            for buyer in users[1:]
+        ]
+
+        try:
+            report = asyncio.run(self.run(users, conversations, options))
+        finally:
+            if not options['keep']:
+                for user in users:
+                    user.delete()
+                category.delete()
+                location.delete()
+
+        for line in report:
+            self.stdout.write(line)
+
+    async def run(self, users, conversations, options):
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+        report = []
+
+        tracemalloc.start()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        began = time.perf_counter()
+        sockets = [FakeSocket(tokens[n % len(tokens)]) for n in range(options['connections'])]
+        tasks = [socket.run() for socket in sockets]
+        await asyncio.gather(*(socket.accepted.wait() for socket in sockets))
+        connect_time = time.perf_counter() - began
+        memory_per_socket = (tracemalloc.get_traced_memory()[0] - memory_before) / len(sockets)
+        tracemalloc.stop()
+
+        refused = sum(socket.closed for socket in sockets)
+        layer = get_channel_layer()
+        report.append(f'{len(sockets)} sockets open in {connect_time:.2f}s, {refused} refused')
+        report.append(f'{layer.subscription_count()} subscriptions, about {memory_per_socket / 1024:.1f} KiB per socket')
+
+        await asyncio.sleep(options['idle'])
+        finished = sum(task.done() for task in tasks)
+        report.append(f'after {options["idle"]}s idle: {len(tasks) - finished} sockets still open')
+
+        sockets_by_user = {}
+        for number, socket in enumerate(sockets):
+            sockets_by_user.setdefault(users[number % len(users)].pk, []).append(socket)
+
+        latencies = []
+        lost = 0
+        for number in range(options['messages']):
+            conversation = conversations[number % len(conversations)]
+            targets = sockets_by_user[conversation.buyer_id] + sockets_by_user[conversation.seller_id]
+            pending = {'count': len(targets)}
+            done = asyncio.Event()
+
+            def on_message(data, pending=pending, done=done):
+                if data.get('type') == 'message':
+                    pending['count'] -= 1
+                    if pending['count'] == 0:
+                        done.set()
+
+            for socket in targets:
+                socket.on_message = on_message
+            sent_at = time.perf_counter()
+            await sync_to_async(send_message)(conversation, conversation.buyer_id, f'offer {number}')
+            try:
+                await asyncio.wait_for(done.wait(), timeout=10)
+                latencies.append(time.perf_counter() - sent_at)
+            except asyncio.TimeoutError:
+                lost += 1
+            for socket in targets:
+                socket.on_message = None
+
+        if latencies:
+            report.append(
+                f'{len(latencies)} messages delivered to {len(targets)} sockets each: '
+                f'p50 {statistics.median(latencies) * 1000:.1f}ms, '
+                f'p99 {percentile(latencies, 0.99) * 1000:.1f}ms, {lost} not delivered in time')
+
+        for socket in sockets:
+            socket.disconnect()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        report.append(f'{layer.subscription_count()} subscriptions left after disconnecting')
+        return report
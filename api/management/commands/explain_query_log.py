@@ -0,0 +1,125 @@
+import json
+import re
+from collections import Counter
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import Resolver404, resolve
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory
+
+
+INDEX_RE = re.compile(
+    r'(?:USING (?:COVERING )?INDEX|Index(?: Only)? Scan using|Bitmap Index Scan on) "?(\w+)"?')
+FULL_SCAN_RE = re.compile(r'(?:\bSCAN (\w+)\s*$|Seq Scan on "?(\w+)"?)')
+
+
+def parse_plan(plan):
+    """
+    Returns the index names and the tables read with a full scan from the
+    output of `QuerySet.explain()` on SQLite or Postgres.
+    """
+    indexes, scans = [], []
+    for line in plan.splitlines():
+        line = line.strip()
+        index = INDEX_RE.search(line)
+        if index:
+            indexes.append(index.group(1))
+            continue
+        scan = FULL_SCAN_RE.search(line)
+        if scan:
+            scans.append(scan.group(1) or scan.group(2))
+    return indexes, scans
+
+
+class Command(BaseCommand):
+    help = ('Replay listing queries from a JSONL log and report which index each one uses. '
+            'Each line needs a `path` (or `url`) and optionally a `query` string or object.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('log', help='Path to the JSONL query log')
+        parser.add_argument('--verbose-plan', action='store_true',
+                            help='Print the full query plan for each query')
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        index_usage = Counter()
+        full_scans = Counter()
+        replayed = skipped = 0
+
+        try:
+            log = open(options['log'])
+        except OSError as e:
+            raise CommandError(e)
+
+        with log:
+            for line_no, line in enumerate(log, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    skipped += 1
+                    continue
+
+                path = entry.get('path') or entry.get('url') if isinstance(entry, dict) else None
+                if not path:
+                    skipped += 1
+                    continue
+                query = entry.get('query') or ''
+                if isinstance(query, dict):
+                    query = urlencode(query, doseq=True)
+                if query:
+                    path = f"{path}{'&' if '?' in path else '?'}{query}"
+
+                try:
+                    queryset = self.build_listing_queryset(factory, path)
+                except ValidationError as e:
+                    self.stdout.write(self.style.WARNING(f'{line_no}: {path} -> invalid filter {e.detail}'))
+                    queryset = None
+                if queryset is None:
+                    skipped += 1
+                    continue
+
+                plan = queryset.explain()
+                indexes, scans = parse_plan(plan)
+                index_usage.update(indexes)
+                full_scans.update(scans)
+                replayed += 1
+
+                if scans:
+                    verdict = self.style.WARNING(f"FULL SCAN {', '.join(scans)}")
+                else:
+                    verdict = self.style.SUCCESS(', '.join(indexes) or 'no table access')
+                if indexes and scans:
+                    verdict = f"{verdict} (+ {', '.join(indexes)})"
+                self.stdout.write(f'{line_no}: {path} -> {verdict}')
+                if options['verbose_plan']:
+                    self.stdout.write(plan)
+
+        self.stdout.write('')
+        self.stdout.write(f'Replayed {replayed} listing queries, skipped {skipped} lines')
+        for index, count in index_usage.most_common():
+            self.stdout.write(f'  {index}: {count}')
+        for table, count in full_scans.most_common():
+            self.stdout.write(self.style.WARNING(f'  full scan of {table}: {count}'))
+
+    def build_listing_queryset(self, factory, path):
+        try:
+            match = resolve(path.split('?', 1)[0])
+        except Resolver404:
+            return None
+
+        view_class = getattr(match.func, 'cls', None)
+        actions = getattr(match.func, 'actions', None) or {}
+        if view_class is None or actions.get('get') != 'list':
+            return None
+
+        view = view_class(action_map=actions, args=match.args, kwargs=match.kwargs, format_kwarg=None)
+        view.request = view.initialize_request(factory.get(path))
+        queryset = view.filter_queryset(view.get_queryset())
+
+        paginator = view.paginator
+        limit = paginator.get_limit(view.request) if paginator else None
+        return queryset[:limit] if limit else queryset
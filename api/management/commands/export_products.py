@@ -0,0 +1,48 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory
+
+from api.utils.export import EXPORT_FORMATS, iter_export
+from api.views import ProductViewSet
+
+
+class Command(BaseCommand):
+    help = ('Stream the product catalog as CSV or JSONL, filtered like /api/v1/product/ '
+            '(e.g. --filter product_type=barter --filter search=phone)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--output', '-o', default=None, help='File to write, defaults to stdout')
+        parser.add_argument('--filter', action='append', default=[], metavar='PARAM=VALUE',
+                            help='Any query param ProductViewSet accepts, may be repeated')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        params = {}
+        for item in options['filter']:
+            key, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError(f'Invalid filter {item!r}, expected PARAM=VALUE')
+            params[key] = value
+
+        view = ProductViewSet(action_map={'get': 'list'}, args=(), kwargs={}, format_kwarg=None)
+        view.request = view.initialize_request(APIRequestFactory().get('/', params))
+        try:
+            queryset = view.filter_queryset(view.get_queryset())
+        except ValidationError as e:
+            raise CommandError(e.detail)
+
+        chunks = iter_export(queryset, file_format=options['format'],
+                             chunk_size=options['chunk_size'], compress=options['gzip'])
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
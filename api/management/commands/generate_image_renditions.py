@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from api import models
+from api.utils.images import process_image
+
+
+class Command(BaseCommand):
+    help = 'Generate image renditions for existing products and users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=['product', 'user'], action='append', default=None)
+        parser.add_argument('--missing-only', action='store_true',
+                            help='Skip rows that already have renditions')
+
+    def handle(self, *args, **options):
+        targets = {'product': models.Product, 'user': models.User}
+        for name in options['model'] or list(targets):
+            model = targets[name]
+            queryset = model._base_manager.exclude(Q(image='') | Q(image__isnull=True))
+            if options['missing_only']:
+                queryset = queryset.filter(image_renditions={})
+            count = 0
+            for pk in queryset.values_list('pk', flat=True).iterator():
+                process_image(model._meta.label, pk)
+                count += 1
+            self.stdout.write(self.style.SUCCESS(f'processed {count} {name} images'))
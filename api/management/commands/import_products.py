@@ -0,0 +1,45 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utils.product_import import IMPORT_FORMATS, guess_format, import_products, iter_rows
+
+
+class Command(BaseCommand):
+    help = 'Stream products from a CSV or JSONL file into the catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with a header row) or JSONL file')
+        parser.add_argument('--user', required=True, help='Email of the user that owns the products')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, default=None)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--errors-out', default=None, help='Write the per-row error report (JSONL) here')
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(email=options['user']).first()
+        if not user:
+            raise CommandError(f"No user with email {options['user']}")
+
+        file_format = options['format'] or guess_format(options['path'])
+        try:
+            stream = open(options['path'], encoding='utf-8-sig', newline='')
+        except OSError as e:
+            raise CommandError(e)
+
+        errors_out = open(options['errors_out'], 'w') if options['errors_out'] else None
+
+        def write_error(error):
+            errors_out.write(json.dumps(error) + '\n')
+
+        with stream:
+            result = import_products(
+                iter_rows(stream, file_format), user.pk, batch_size=options['batch_size'],
+                max_errors=20, error_sink=write_error if errors_out else None)
+
+        if errors_out:
+            errors_out.close()
+        for error in result.errors:
+            self.stdout.write(self.style.WARNING(json.dumps(error)))
+
+        self.stdout.write(self.style.SUCCESS(f'created {result.created}, failed {result.failed}'))
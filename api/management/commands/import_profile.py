@@ -0,0 +1,97 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# what a cold serverless worker does before it answers its first product request
+COLD_START_SCRIPT = '''
+import os, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'naija_barter.settings')
+began = time.perf_counter()
+from naija_barter.wsgi import application
+from django.urls import resolve
+from rest_framework.settings import api_settings
+resolve('/api/v1/product/')
+for name in ('DEFAULT_AUTHENTICATION_CLASSES', 'DEFAULT_PERMISSION_CLASSES', 'DEFAULT_RENDERER_CLASSES',
+             'DEFAULT_PARSER_CLASSES', 'DEFAULT_PAGINATION_CLASS', 'DEFAULT_FILTER_BACKENDS'):
+    getattr(api_settings, name)
+print('cold-start-ms', (time.perf_counter() - began) * 1000)
+'''
+
+_line_re = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def parse_importtime(output):
+    """
+    Returns [(module, self us, cumulative us, depth)] from `-X importtime`.
+    """
+    modules = []
+    for line in output.splitlines():
+        match = _line_re.match(line)
+        if match:
+            depth = (len(match.group(3)) - 1) // 2
+            modules.append((match.group(4), int(match.group(1)), int(match.group(2)), depth))
+    return modules
+
+
+class Command(BaseCommand):
+    help = ('Measure the cold start of the WSGI entry point in a fresh interpreter and report '
+            'import time per package')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help='Cold starts timed, the fastest is reported')
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--lazy', choices=['0', '1'], default=None,
+                            help='Force LAZY_STARTUP off or on, by default the current setting is used')
+        parser.add_argument('--budget-ms', type=float, default=None,
+                            help='Fail when the cold start takes longer than this')
+        parser.add_argument('--json', action='store_true')
+
+    def run_script(self, env, importtime=False):
+        command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', COLD_START_SCRIPT]
+        result = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1] if result.stderr else 'cold start failed')
+        ready = float(re.search(r'cold-start-ms ([0-9.]+)', result.stdout).group(1))
+        return ready, result.stderr
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        env['LAZY_STARTUP'] = options['lazy'] if options['lazy'] is not None else str(int(settings.LAZY_STARTUP))
+
+        cold_start = min(self.run_script(env)[0] for _ in range(max(options['runs'], 1)))
+        _, stderr = self.run_script(env, importtime=True)
+        modules = parse_importtime(stderr)
+
+        packages = defaultdict(int)
+        for name, self_us, _, _ in modules:
+            packages[name.split('.')[0]] += self_us
+        ranked = sorted(packages.items(), key=lambda item: -item[1])[:options['top']]
+        slowest = sorted(modules, key=lambda module: -module[1])[:options['top']]
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'lazy_startup': env['LAZY_STARTUP'] == '1',
+                'cold_start_ms': round(cold_start, 1),
+                'modules_imported': len(modules),
+                'packages_ms': {name: round(us / 1000, 2) for name, us in ranked},
+                'modules_ms': {name: round(us / 1000, 2) for name, us, _, _ in slowest},
+            }, indent=2))
+        else:
+            self.stdout.write(f"LAZY_STARTUP={env['LAZY_STARTUP']}: cold start {cold_start:.1f} ms, "
+                              f'{len(modules)} modules imported')
+            self.stdout.write('import time by package (self time, ms)')
+            for name, us in ranked:
+                self.stdout.write(f'  {name:<32} {us / 1000:8.2f}')
+            self.stdout.write('slowest modules (self time, ms)')
+            for name, us, _, _ in slowest:
+                self.stdout.write(f'  {name:<48} {us / 1000:8.2f}')
+
+        if options['budget_ms'] is not None and cold_start > options['budget_ms']:
+            raise CommandError(f"cold start {cold_start:.1f} ms is over the {options['budget_ms']:.0f} ms budget")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.utils.mail import purge_outbound_emails
+
+
+class Command(BaseCommand):
+    help = 'Delete sent and failed outbound emails older than EMAIL_OUTBOX_RETENTION_DAYS'
+
+    def handle(self, *args, **options):
+        deleted = purge_outbound_emails()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} old outbound emails'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api import models
+from api.utils import barter
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the barter wants/haves index from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        models.BarterToken.objects.all().delete()
+        products = models.Product.objects.filter(is_active=True).select_related(
+            'category').order_by('pk').iterator(chunk_size=options['batch_size'])
+        count = barter.index_products(products, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} products'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.utils.flash_sales import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Release flash sale reservations whose time ran out and give their stock back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        released = release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired reservations'))
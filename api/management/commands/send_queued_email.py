@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.utils.mail import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbound emails in batches over one SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the outbox instead of exiting once it is empty')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds to sleep between polls when the outbox is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, retried, failed = send_queued_emails(options['batch_size'])
+            if sent or retried or failed:
+                self.stdout.write(f'sent {sent}, retrying {retried}, failed {failed}')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
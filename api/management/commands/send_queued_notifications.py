@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.utils.notifications import run_notification_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run the queued match and price drop notification fan-out in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the queue instead of exiting once it is empty')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds to sleep between polls when the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            done, failed = run_notification_jobs(options['batch_size'])
+            if done or failed:
+                self.stdout.write(f'ran {done}, failed {failed}')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
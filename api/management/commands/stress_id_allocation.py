@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.utils.crypto import get_random_string
+
+from api import models
+
+
+def classify_query(sql):
+    table = models.Product._meta.db_table
+    if sql.startswith(f'INSERT INTO "{table}"'):
+        return 'product inserts'
+    if f'FROM "{table}" WHERE "{table}"."id" IN' in sql:
+        return 'id block reservations'
+    if f'FROM "{table}"' in sql and f'"{table}"."id" =' in sql:
+        return 'id conflict checks'
+    return 'other (signals, savepoints)'
+
+
+class Command(BaseCommand):
+    help = ('Create products from many threads at once and check that the id allocator '
+            'produces no duplicates and no per-insert id probes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--per-thread', type=int, default=50)
+        parser.add_argument('--bulk', action='store_true', help='Insert with bulk_create instead of save()')
+        parser.add_argument('--keep', action='store_true', help='Keep the created rows')
+
+    def handle(self, *args, **options):
+        suffix = get_random_string(8)
+        user = models.User.objects.create_user(
+            email=f'stress-{suffix}@example.invalid', password=f'stress{suffix}1')
+        category = models.Category.objects.create(name=f'stress-{suffix}')
+        location = models.Location.objects.create(state=f'stress-{suffix}')
+
+        created_ids = []
+        errors = []
+        queries = Counter()
+        lock = threading.Lock()
+        start = threading.Barrier(options['threads'])
+
+        def build(index):
+            return models.Product(
+                user=user, category=category, location=location, name=f'stress {index}',
+                description='stress test', product_type='declutter')
+
+        def worker(number):
+            ids = []
+            try:
+                with CaptureQueriesContext(connections['default']) as context:
+                    start.wait()
+                    if options['bulk']:
+                        products = models.Product.objects.bulk_create(
+                            [build(i) for i in range(options['per_thread'])])
+                        ids.extend(product.pk for product in products)
+                    else:
+                        for i in range(options['per_thread']):
+                            product = build(i)
+                            product.save()
+                            ids.append(product.pk)
+                with lock:
+                    created_ids.extend(ids)
+                    queries.update(classify_query(q['sql']) for q in context.captured_queries)
+            except Exception as e:
+                with lock:
+                    errors.append(f'thread {number}: {e!r}')
+            finally:
+                connections['default'].close()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(options['threads'])]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        stored = models.Product.objects.filter(category=category).count()
+        duplicates = len(created_ids) - len(set(created_ids))
+
+        self.stdout.write(f'created {len(created_ids)} products in {elapsed:.2f}s, {stored} stored')
+        for kind, count in sorted(queries.items()):
+            self.stdout.write(f'  {kind}: {count}')
+        for error in errors:
+            self.stdout.write(self.style.ERROR(error))
+
+        if not options['keep']:
+            user.delete()
+            category.delete()
+            location.delete()
+            connection.close()
+
+        if duplicates or errors or stored != len(created_ids):
+            raise CommandError(f'{duplicates} duplicate ids, {len(errors)} thread errors')
+        self.stdout.write(self.style.SUCCESS('no duplicate ids'))
@@ -0,0 +1,28 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Copy the local sqlite database into the sqlite files standing in for the read replicas '
+            '(TRY_LOCAL_DB=1 TRY_LOCAL_REPLICA=1), run it again to let the replicas catch up')
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite' or not settings.DATABASE_REPLICAS:
+            raise CommandError('Only for the local sqlite setup with TRY_LOCAL_REPLICA=1')
+
+        source = sqlite3.connect(primary.settings_dict['NAME'])
+        try:
+            for alias in settings.DATABASE_REPLICAS:
+                connections[alias].close()
+                target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(self.style.SUCCESS(f'Copied the primary into {alias}'))
+        finally:
+            source.close()
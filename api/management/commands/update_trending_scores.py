@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.utils.engagement import engagement_buffer, update_trending_scores
+
+
+class Command(BaseCommand):
+    help = 'Fold the new view and contact counts into the decayed trending scores and rebuild the hot deals ranking'
+
+    def handle(self, *args, **options):
+        # counts buffered by this process, web workers flush their own
+        engagement_buffer.flush()
+        updated = update_trending_scores()
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} trending scores'))
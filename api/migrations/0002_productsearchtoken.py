@@ -0,0 +1,30 @@
+# Generated by Django 4.2.4 on 2026-10-18 10:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=50)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='api.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'product'], name='api_product_token_f709a0_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='productsearchtoken',
+            constraint=models.UniqueConstraint(fields=('product', 'token'), name='unique_product_search_token'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.2.4 on 2026-10-18 10:38
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class AddIndexConcurrentlyOnPostgres(AddIndexConcurrently):
+    """
+    Builds the index without locking the product table against writes on
+    PostgreSQL, other databases (SQLite locally) get a plain AddIndex.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('api', '0002_productsearchtoken'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'product_type', 'created_at'], name='product_active_type_created'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'category', 'price'], name='product_active_category_price'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='product',
+            index=models.Index(fields=['user', 'created_at'], name='product_user_created'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at', 'id'], name='product_live_created'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['price', 'id'], name='product_live_price'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['name', 'id'], name='product_live_name'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'created_at'], name='product_live_category_created'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['location', 'created_at'], name='product_live_location_created'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['exchange'], name='product_live_exchange'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.4 on 2026-10-18 10:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BarterToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('want', 'Want'), ('have', 'Have')], max_length=4)),
+                ('token', models.CharField(max_length=50)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='barter_tokens', to='api.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'token', 'product'], name='barter_token_lookup')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bartertoken',
+            constraint=models.UniqueConstraint(fields=('product', 'kind', 'token'), name='unique_barter_token'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.4 on 2026-10-18 11:09
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_chat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlashSale',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('price', models.DecimalField(decimal_places=0, max_digits=20, validators=[django.core.validators.MinValueValidator(0)])),
+                ('quantity', models.PositiveIntegerField()),
+                ('stock', models.PositiveIntegerField(editable=False)),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='flash_sales', to='api.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('status', models.CharField(choices=[('held', 'Held'), ('confirmed', 'Confirmed'), ('released', 'Released')], default='held', max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField()),
+                ('confirmed_at', models.DateTimeField(blank=True, null=True)),
+                ('released_at', models.DateTimeField(blank=True, null=True)),
+                ('sale', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='api.flashsale')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'held')), fields=['expires_at'], name='stock_reservation_held_expiry')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockreservation',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'held')), fields=('sale', 'user'), name='unique_held_stock_reservation'),
+        ),
+        migrations.AddIndex(
+            model_name='flashsale',
+            index=models.Index(fields=['ends_at', 'starts_at'], name='flash_sale_window'),
+        ),
+        migrations.AddConstraint(
+            model_name='flashsale',
+            constraint=models.CheckConstraint(check=models.Q(('ends_at__gt', models.F('starts_at'))), name='flash_sale_window_order'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.4 on 2026-10-18 11:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_flash_sales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductEngagement',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='engagement', serialize=False, to='api.product')),
+                ('views', models.PositiveBigIntegerField(default=0)),
+                ('contacts', models.PositiveBigIntegerField(default=0)),
+                ('scored_views', models.PositiveBigIntegerField(default=0)),
+                ('scored_contacts', models.PositiveBigIntegerField(default=0)),
+                ('score', models.FloatField(default=0)),
+                ('scored_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('score__gt', 0)), fields=['-score'], name='product_engagement_score'), models.Index(fields=['scored_at'], name='product_engagement_scored_at')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.4 on 2026-10-18 11:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_product_engagement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedProduct',
+            fields=[
+                ('id', models.CharField(editable=False, max_length=6, primary_key=True, serialize=False)),
+                ('image', models.ImageField(blank=True, null=True, upload_to='images/product/')),
+                ('image_renditions', models.JSONField(blank=True, default=dict, editable=False)),
+                ('name', models.CharField(max_length=250)),
+                ('description', models.TextField(max_length=1000)),
+                ('is_active', models.BooleanField(default=True)),
+                ('price', models.DecimalField(decimal_places=0, default=0, max_digits=20)),
+                ('exchange', models.CharField(blank=True, max_length=250, null=True)),
+                ('product_type', models.CharField(choices=[('barter', 'Barter'), ('declutter', 'Declutter'), ('gift', 'Gift')], max_length=10)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_products', to='api.category')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_products', to='api.location')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_products', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'archived_at'], name='archived_product_user'), models.Index(fields=['archived_at'], name='archived_product_archived')],
+            },
+        ),
+    ]
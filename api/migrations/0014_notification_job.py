@@ -0,0 +1,27 @@
+# Generated by Django 4.2.4 on 2026-10-18 11:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_outbound_email_sending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('new_product', 'New product'), ('price_drop', 'Price drop')], max_length=20)),
+                ('old_price', models.DecimalField(blank=True, decimal_places=0, max_digits=20, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('claimed_until', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_jobs', to='api.product')),
+            ],
+        ),
+    ]
@@ -1,33 +1,111 @@
+import copy
 from datetime import timedelta
 import random
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, models
+from django.db.models import F
+from django.db.models.fields.files import FieldFile
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from django.utils.crypto import get_random_string
 from django.utils import timezone
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
 from api.utils.helpers import validate_alphanumeric_password
+from api.utils.ids import AllocatedIdQuerySet, get_id_allocator, run_with_conflict_retry
 
 # Create your models here.
 
 
+def _snapshot(value):
+    if isinstance(value, FieldFile):
+        return value.name
+    if isinstance(value, (dict, list)):
+        # JSON values are changed in place, the snapshot must not be the same object
+        return copy.deepcopy(value)
+    return value
+
+
 class BaseModel(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def generate_unique_id(self):
-        allowed_chars = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-        unique_id = get_random_string(length=6, allowed_chars=allowed_chars)
-        while self.__class__.objects.filter(id=unique_id).exists():
-            unique_id = get_random_string(
-                length=6, allowed_chars=allowed_chars)
-        return unique_id
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: _snapshot(value) for name, value in zip(field_names, values) if value is not models.DEFERRED
+        }
+        return instance
+
+    def _snapshot_value(self, field):
+        return _snapshot(getattr(self, field.attname))
+
+    def get_dirty_fields(self):
+        """
+        Returns the names of the fields changed since the instance was loaded,
+        or None when the instance was not loaded from the database.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        dirty = []
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in self.__dict__:
+                continue
+            if field.attname not in loaded or loaded[field.attname] != self._snapshot_value(field):
+                dirty.append(field.name)
+        return dirty
+
+    def has_changed(self, field_name):
+        dirty = self.get_dirty_fields()
+        return dirty is None or field_name in dirty
+
+    def save(self, *args, **kwargs):
+        if (not args and kwargs.get('update_fields') is None and not kwargs.get('force_insert')
+                and not self._state.adding):
+            dirty = self.get_dirty_fields()
+            if dirty is not None:
+                # only write the changed columns, nothing changed means no query
+                kwargs['update_fields'] = dirty + ['updated_at'] if dirty else []
+
+        if self._state.adding and getattr(self, '_allocated_id', False) and not args:
+            # the allocated id is only known to be free, insert straight away and
+            # let the primary key constraint catch the rare conflict
+            using = kwargs.get('using') or DEFAULT_DB_ALIAS
+            kwargs['force_insert'] = True
+
+            def on_conflict():
+                if not self.__class__._base_manager.using(using).filter(pk=self.pk).exists():
+                    return False
+                self.pk = get_id_allocator(self.__class__).allocate(using=using)[0]
+                return True
+
+            run_with_conflict_retry(using, lambda: super(BaseModel, self).save(*args, **kwargs), on_conflict)
+            self._allocated_id = False
+        else:
+            super().save(*args, **kwargs)
+
+        self._loaded_values = {
+            field.attname: self._snapshot_value(field)
+            for field in self._meta.concrete_fields if field.attname in self.__dict__
+        }
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is not None:
+            for field in self._meta.concrete_fields:
+                if field.attname in self.__dict__ and (fields is None or field.name in fields
+                                                       or field.attname in fields):
+                    loaded[field.attname] = self._snapshot_value(field)
+
+    def generate_unique_id(self, using=None):
+        self._allocated_id = True
+        return get_id_allocator(self.__class__).allocate(using=using or DEFAULT_DB_ALIAS)[0]
 
     class Meta:
         abstract = True
 
 
-class MyUserManager(BaseUserManager):
+class MyUserManager(BaseUserManager.from_queryset(AllocatedIdQuerySet)):
     use_in_migrations = True
 
     def _create_user(self, email, password=None, **extra_fields):
@@ -56,6 +134,7 @@ class MyUserManager(BaseUserManager):
 class User(AbstractBaseUser, PermissionsMixin, BaseModel):
     id = models.CharField(primary_key=True, max_length=6, editable=False)
     image = models.ImageField(upload_to='images/user/', blank=True, null=True)
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
     email = models.EmailField(unique=True)
     name = models.CharField(max_length=250)
     phone = models.CharField(max_length=25)
@@ -75,28 +154,48 @@ class User(AbstractBaseUser, PermissionsMixin, BaseModel):
     otp_tries = models.IntegerField(default=0)
     otp = models.CharField(max_length=6, null=True, blank=True)
     otp_expiry_date = models.DateTimeField(null=True, blank=True)
+    # tokens issued before this are revoked, see api.utils.revocation
+    tokens_valid_after = models.DateTimeField(null=True, blank=True, editable=False)
+    # kept in step with the notifications by api.utils.notifications
+    unread_notifications = models.PositiveIntegerField(default=0, editable=False)
 
     objects = MyUserManager()
 
     USERNAME_FIELD = 'email'
 
     def save(self, *args, **kwargs):
-        if not self.id:
-            self.id = self.generate_unique_id()
+        new_id = not self.id
+        if new_id:
+            self.id = self.generate_unique_id(kwargs.get('using'))
 
         if self.is_business:
             if not self.business_name or not self.regitration_no or not self.location:
                 raise ValidationError(
                     'Business most have business name, regitration no. and location')
 
-        user = self.__class__.objects.filter(id=self.id).first()
-        if not user or user and user.password != self.password:
+        if new_id:
+            exists = False
+            password_changed = True
+        elif self.get_dirty_fields() is not None:
+            exists = True
+            password_changed = self.has_changed('password')
+        else:
+            # not loaded from the database, compare with the stored password
+            stored_password = self.__class__.objects.filter(
+                id=self.id).values_list('password', flat=True).first()
+            exists = stored_password is not None
+            password_changed = stored_password != self.password
+
+        if password_changed:
             if len(self.password) < 8 or not validate_alphanumeric_password(self.password):
                 raise ValidationError(
                     'Password most be alpha numeric and greater than 8 characters')
             self.set_password(self.password)
+            if exists:
+                # a new password logs out every session that used the old one
+                self.tokens_valid_after = timezone.now()
 
-        if user and not self.is_staff and self.is_superuser:
+        if exists and not self.is_staff and self.is_superuser:
             self.is_staff = True
 
         super().save(*args, **kwargs)
@@ -113,11 +212,15 @@ class User(AbstractBaseUser, PermissionsMixin, BaseModel):
     def verify_otp(self, otp):
         origin_otp = self.otp
         origin_otp_expiry_date = self.otp_expiry_date
-        self.otp_tries = self.otp_tries + 1
-        self.save()
 
-        if self.otp_tries-1 > 5:
+        # atomic increment, only while the user still has tries left
+        counted = self.__class__.objects.filter(pk=self.pk, otp_tries__lte=5).update(
+            otp_tries=F('otp_tries') + 1)
+        if not counted:
             return False
+        self.otp_tries += 1
+        if getattr(self, '_loaded_values', None) is not None:
+            self._loaded_values['otp_tries'] = self.otp_tries
 
         if not otp or not origin_otp or not origin_otp_expiry_date:
             return False
@@ -159,6 +262,7 @@ class Product(BaseModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     image = models.ImageField(
         upload_to='images/product/', blank=True, null=True)
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
     name = models.CharField(max_length=250)
     description = models.TextField(max_length=1000)
     is_active = models.BooleanField(default=True)
@@ -169,16 +273,316 @@ class Product(BaseModel):
     exchange = models.CharField(max_length=250, blank=True, null=True)
     product_type = models.CharField(max_length=10, choices=PRODUCT_CHOICES)
 
+    objects = AllocatedIdQuerySet.as_manager()
+    # archived products keep their id, see api.utils.archive
+    id_shared_with = ['api.ArchivedProduct']
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', 'product_type', 'created_at'],
+                         name='product_active_type_created'),
+            models.Index(fields=['is_active', 'category', 'price'],
+                         name='product_active_category_price'),
+            models.Index(fields=['user', 'created_at'], name='product_user_created'),
+            # partial indexes, listings always filter on is_active=True
+            models.Index(fields=['created_at', 'id'], condition=models.Q(is_active=True),
+                         name='product_live_created'),
+            models.Index(fields=['price', 'id'], condition=models.Q(is_active=True),
+                         name='product_live_price'),
+            models.Index(fields=['name', 'id'], condition=models.Q(is_active=True),
+                         name='product_live_name'),
+            models.Index(fields=['category', 'created_at'], condition=models.Q(is_active=True),
+                         name='product_live_category_created'),
+            models.Index(fields=['location', 'created_at'], condition=models.Q(is_active=True),
+                         name='product_live_location_created'),
+            models.Index(fields=['exchange'], condition=models.Q(is_active=True),
+                         name='product_live_exchange'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.id:
-            self.id = self.generate_unique_id()
+            self.id = self.generate_unique_id(kwargs.get('using'))
+
+        self.check_product_type(self.product_type, self.exchange, self.price)
+
+        super().save(*args, **kwargs)
 
-        if self.product_type == 'barter':
-            if not self.exchange:
+    @staticmethod
+    def check_product_type(product_type, exchange, price):
+        if product_type == 'barter':
+            if not exchange:
                 raise ValidationError(
                     "Product type barter most have an exchange")
 
-        if self.product_type == 'gift':
-            if self.price != 0:
+        if product_type == 'gift':
+            if price != 0:
                 raise ValidationError(
                     "Product type gift most have price of zero")
+
+
+class ArchivedProduct(models.Model):
+    """
+    Products moved out of the live `Product` table by `api.utils.archive`,
+    with the same columns so they are restored as they were.
+    """
+    id = models.CharField(primary_key=True, max_length=6, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_products')
+    image = models.ImageField(
+        upload_to='images/product/', blank=True, null=True)
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    name = models.CharField(max_length=250)
+    description = models.TextField(max_length=1000)
+    is_active = models.BooleanField(default=True)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='archived_products')
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='archived_products')
+    price = models.DecimalField(max_digits=20, decimal_places=0, default=0)
+    exchange = models.CharField(max_length=250, blank=True, null=True)
+    product_type = models.CharField(max_length=10, choices=Product.PRODUCT_CHOICES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'archived_at'], name='archived_product_user'),
+            models.Index(fields=['archived_at'], name='archived_product_archived'),
+        ]
+
+
+class ProductSearchToken(models.Model):
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=50)
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['token', 'product']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'token'], name='unique_product_search_token'),
+        ]
+
+
+class BarterToken(models.Model):
+    KIND_CHOICES = [
+        ('want', 'Want'),
+        ('have', 'Have'),
+    ]
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='barter_tokens')
+    kind = models.CharField(max_length=4, choices=KIND_CHOICES)
+    token = models.CharField(max_length=50)
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'token', 'product'], name='barter_token_lookup'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'kind', 'token'], name='unique_barter_token'),
+        ]
+
+
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=255, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='revoked_tokens')
+    revoked_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['revoked_at'], name='revoked_token_revoked_at'),
+            models.Index(fields=['expires_at'], name='revoked_token_expires_at'),
+        ]
+
+
+class ProductEngagement(models.Model):
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name='engagement')
+    # written by the buffered counters in api.utils.engagement, never by save()
+    views = models.PositiveBigIntegerField(default=0)
+    contacts = models.PositiveBigIntegerField(default=0)
+    # the counts already folded into the score
+    scored_views = models.PositiveBigIntegerField(default=0)
+    scored_contacts = models.PositiveBigIntegerField(default=0)
+    score = models.FloatField(default=0)
+    scored_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score'], condition=models.Q(score__gt=0), name='product_engagement_score'),
+            models.Index(fields=['scored_at'], name='product_engagement_scored_at'),
+        ]
+
+
+class FlashSale(BaseModel):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='flash_sales')
+    price = models.DecimalField(max_digits=20, decimal_places=0, validators=[MinValueValidator(0)])
+    quantity = models.PositiveIntegerField()
+    # what is left to reserve, only ever changed with conditional updates, see api.utils.flash_sales
+    stock = models.PositiveIntegerField(editable=False)
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ends_at', 'starts_at'], name='flash_sale_window'),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(ends_at__gt=F('starts_at')), name='flash_sale_window_order'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.stock is None:
+            self.stock = self.quantity
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f'{self.product_id} {self.starts_at} {self.ends_at}'
+
+
+class StockReservation(models.Model):
+    STATUS_CHOICES = [
+        ('held', 'Held'),
+        ('confirmed', 'Confirmed'),
+        ('released', 'Released'),
+    ]
+
+    sale = models.ForeignKey(FlashSale, on_delete=models.CASCADE, related_name='reservations')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_reservations')
+    quantity = models.PositiveIntegerField(default=1)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='held')
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+    confirmed_at = models.DateTimeField(null=True, blank=True)
+    released_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], condition=models.Q(status='held'),
+                         name='stock_reservation_held_expiry'),
+        ]
+        constraints = [
+            # one open reservation per user and sale
+            models.UniqueConstraint(fields=['sale', 'user'], condition=models.Q(status='held'),
+                                    name='unique_held_stock_reservation'),
+        ]
+
+    def __str__(self):
+        return f'{self.sale_id} {self.user_id} {self.status}'
+
+
+class Conversation(BaseModel):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='conversations')
+    buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='buyer_conversations')
+    # the product owner, copied so the inbox queries do not join products
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='seller_conversations')
+    last_message_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['buyer', 'last_message_at'], name='conversation_buyer_inbox'),
+            models.Index(fields=['seller', 'last_message_at'], name='conversation_seller_inbox'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'buyer'], name='unique_product_conversation'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} {self.buyer_id} {self.seller_id}'
+
+
+class Message(models.Model):
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
+    body = models.TextField(max_length=2000)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', 'id'], name='message_conversation_id'),
+        ]
+
+    def __str__(self):
+        return f'{self.conversation_id} {self.sender_id}'
+
+
+class Notification(models.Model):
+    KIND_CHOICES = [
+        ('match', 'Match'),
+        ('message', 'Message'),
+        ('price_drop', 'Price drop'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    title = models.CharField(max_length=250)
+    body = models.TextField(blank=True, default='')
+    data = models.JSONField(default=dict, blank=True)
+    read_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='notification_user_id'),
+            models.Index(fields=['user', 'id'], condition=models.Q(read_at__isnull=True),
+                         name='notification_user_unread'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} {self.kind} {self.title}'
+
+
+class NotificationJob(models.Model):
+    """
+    Notification fan-out queued by product saves, run by the
+    `send_queued_notifications` worker so the saving request does not wait
+    on it.
+    """
+    KIND_CHOICES = [
+        ('new_product', 'New product'),
+        ('price_drop', 'Price drop'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='notification_jobs')
+    # the price before the drop, nobody is told when it went back up since
+    old_price = models.DecimalField(max_digits=20, decimal_places=0, null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.kind} {self.product_id}'
+
+
+class OutboundEmail(BaseModel):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=250)
+    body = models.TextField()
+    html_body = models.TextField(blank=True, null=True)
+    from_email = models.CharField(max_length=254)
+    to = models.TextField()  # comma separated addresses
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due'),
+        ]
+
+    def __str__(self):
+        return f'{self.to} {self.subject}'
@@ -1,12 +1,24 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
 from api import models
+from api.utils.fieldsets import ExpandableFieldsMixin
+from api.utils.images import rendition_urls
 
 
-class UserSerializer(serializers.ModelSerializer):
+class ImageRenditionsField(serializers.ReadOnlyField):
+    def to_representation(self, value):
+        return rendition_urls(value)
+
+
+class UserSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    image_renditions = ImageRenditionsField()
+
     class Meta:
         model = models.User
         exclude = (
-            'groups', 'user_permissions', 'last_login', 'password', 'otp', 'otp_expiry_date', 'otp_tries'
+            'groups', 'user_permissions', 'last_login', 'password', 'otp', 'otp_expiry_date', 'otp_tries',
+            'tokens_valid_after', 'unread_notifications',
             )
         
         extra_kwargs = {
@@ -24,7 +36,8 @@ class UserSerializerCreate(serializers.ModelSerializer):
     class Meta:
         model = models.User
         exclude = (
-            'groups', 'user_permissions', 'last_login', 'otp', 'otp_expiry_date', 'otp_tries'
+            'groups', 'user_permissions', 'last_login', 'otp', 'otp_expiry_date', 'otp_tries',
+            'tokens_valid_after', 'unread_notifications',
             )
         
         extra_kwargs = {
@@ -43,10 +56,17 @@ class UserAndTokenSerializer(UserSerializer):
     token = serializers.CharField()
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    image_renditions = ImageRenditionsField()
+
     class Meta:
         model = models.Product
         fields = '__all__'
+        expandable_fields = {
+            'user': 'api.serializers.core.UserSerializer',
+            'category': 'api.serializers.core.CategorySerializer',
+            'location': 'api.serializers.core.LocationSerializer',
+        }
         
         extra_kwargs = {
             'is_active': {'read_only': True},
@@ -54,6 +74,202 @@ class ProductSerializer(serializers.ModelSerializer):
             'updated_at': {'read_only': True},
         }
 
+    def validate(self, attrs):
+        def current(field, default=None):
+            return attrs.get(field, getattr(self.instance, field, default))
+
+        try:
+            models.Product.check_product_type(
+                current('product_type'), current('exchange'), current('price', 0))
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
+        return attrs
+
+
+class ArchivedProductSerializer(serializers.ModelSerializer):
+    image_renditions = ImageRenditionsField()
+
+    class Meta:
+        model = models.ArchivedProduct
+        fields = '__all__'
+        read_only_fields = [field.name for field in models.ArchivedProduct._meta.concrete_fields]
+
+
+class ProductImportSerializer(ProductSerializer):
+    """
+    Validates one imported row, category and location may be given by id or
+    name and are resolved from the maps passed in the context.
+    """
+    category = serializers.CharField()
+    location = serializers.CharField()
+    image_renditions = None
+
+    class Meta(ProductSerializer.Meta):
+        fields = ('name', 'description', 'price', 'exchange', 'product_type', 'category', 'location')
+
+    def resolve(self, lookup, value, label):
+        instance = self.context[lookup].get(str(value).strip().lower())
+        if instance is None:
+            raise serializers.ValidationError(f'Unknown {label} "{value}"')
+        return instance
+
+    def validate_category(self, value):
+        return self.resolve('categories', value, 'category')
+
+    def validate_location(self, value):
+        return self.resolve('locations', value, 'location')
+
+
+class ProductImportRequestSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=['csv', 'jsonl'], required=False)
+
+
+class ProductImportResultSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    failed = serializers.IntegerField()
+    errors = serializers.ListField(child=serializers.DictField())
+
+
+class BarterMatchSerializer(serializers.Serializer):
+    score = serializers.IntegerField()
+    product = ProductSerializer()
+    receives = serializers.ListField(child=serializers.CharField())
+    gives = serializers.ListField(child=serializers.CharField())
+
+
+class BarterCycleSerializer(serializers.Serializer):
+    score = serializers.IntegerField()
+    # the product gets the first one, whose owner gets the second one
+    products = ProductSerializer(many=True)
+
+
+class BarterMatchesSerializer(serializers.Serializer):
+    two_way = BarterMatchSerializer(many=True)
+    three_way = BarterCycleSerializer(many=True)
+
+
+class HotProductSerializer(serializers.Serializer):
+    score = serializers.FloatField()
+    product = ProductSerializer()
+
+
+class FacetCountSerializer(serializers.Serializer):
+    value = serializers.CharField()
+    label = serializers.CharField()
+    count = serializers.IntegerField()
+
+
+class PriceFacetCountSerializer(serializers.Serializer):
+    value = serializers.CharField()
+    min = serializers.IntegerField()
+    max = serializers.IntegerField(allow_null=True)
+    count = serializers.IntegerField()
+
+
+class ProductFacetsSerializer(serializers.Serializer):
+    count = serializers.IntegerField()
+    product_type = FacetCountSerializer(many=True)
+    category = FacetCountSerializer(many=True)
+    location = FacetCountSerializer(many=True)
+    price = PriceFacetCountSerializer(many=True)
+
+
+class FlashSaleSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = models.FlashSale
+        fields = ('id', 'product', 'price', 'quantity', 'stock', 'starts_at', 'ends_at', 'created_at')
+        read_only_fields = ('stock', 'created_at')
+        expandable_fields = {
+            'product': 'api.serializers.core.ProductSerializer',
+        }
+
+    def validate_product(self, product):
+        if not product.is_active:
+            raise serializers.ValidationError('Product is not available')
+        if product.user_id != self.context['request'].user.pk:
+            raise serializers.ValidationError('You can only put your own products on sale')
+        return product
+
+    def validate(self, attrs):
+        if attrs['ends_at'] <= attrs['starts_at']:
+            raise serializers.ValidationError({'ends_at': 'The sale must end after it starts'})
+        if attrs['quantity'] < 1:
+            raise serializers.ValidationError({'quantity': 'Put at least one unit on sale'})
+        return attrs
+
+
+class FlashSaleListingSerializer(FlashSaleSerializer):
+    is_live = serializers.BooleanField()
+
+    class Meta(FlashSaleSerializer.Meta):
+        fields = FlashSaleSerializer.Meta.fields + ('is_live',)
+
+
+class StockReservationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.StockReservation
+        fields = ('id', 'sale', 'quantity', 'status', 'created_at', 'expires_at', 'confirmed_at', 'released_at')
+        read_only_fields = fields
+
+
+class StockReservationRequestSerializer(serializers.Serializer):
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+    def validate_quantity(self, quantity):
+        limit = settings.FLASH_SALE_MAX_QUANTITY
+        if quantity > limit:
+            raise serializers.ValidationError(f'At most {limit} per reservation')
+        return quantity
+
+
+class ConversationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.Conversation
+        fields = ('id', 'product', 'buyer', 'seller', 'last_message_at', 'created_at')
+        read_only_fields = ('buyer', 'seller', 'last_message_at', 'created_at')
+
+    def validate_product(self, product):
+        if not product.is_active:
+            raise serializers.ValidationError('Product is not available')
+        if product.user_id == self.context['request'].user.pk:
+            raise serializers.ValidationError('You cannot start a conversation about your own product')
+        return product
+
+
+class MessageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.Message
+        fields = ('id', 'conversation', 'sender', 'body', 'created_at')
+        read_only_fields = ('conversation', 'sender', 'created_at')
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.Notification
+        fields = ('id', 'kind', 'title', 'body', 'data', 'read_at', 'created_at')
+        read_only_fields = fields
+
+
+class NotificationPollSerializer(serializers.Serializer):
+    results = NotificationSerializer(many=True)
+    # pass back as ?after= on the next poll
+    cursor = serializers.IntegerField()
+    has_more = serializers.BooleanField()
+    unread = serializers.IntegerField()
+    # seconds to wait before the next poll, set when ?wait= could not be honoured
+    retry_after = serializers.IntegerField()
+
+
+class NotificationReadSerializer(serializers.Serializer):
+    # every unread notification when left out
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=1000)
+
+
+class NotificationReadResultSerializer(serializers.Serializer):
+    marked = serializers.IntegerField()
+    unread = serializers.IntegerField()
+
 
 class LocationSerializer(serializers.ModelSerializer):
     class Meta:
@@ -76,3 +292,10 @@ class CategorySerializer(serializers.ModelSerializer):
             'updated_at': {'read_only': True},
         }
 
+
+class CacheStatsSerializer(serializers.Serializer):
+    name = serializers.CharField()
+    local_hits = serializers.IntegerField()
+    shared_hits = serializers.IntegerField()
+    misses = serializers.IntegerField()
+    local_entries = serializers.IntegerField()
@@ -0,0 +1,158 @@
+from django.core.signals import request_finished
+from django.db import close_old_connections
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from api import models
+from api.utils import barter, facets, notifications, search
+from api.utils.caching import bump_version, category_cache, location_cache
+from api.utils.db_routing import pin_user
+from api.utils.engagement import engagement_buffer
+from api.utils.images import schedule_renditions
+from api.utils.perms_and_auth import USER_STATUS_FIELDS, invalidate_user_status
+
+
+SEARCH_FIELDS = {'name', 'description', 'exchange', 'category', 'location'}
+
+
+@receiver(post_save, sender=models.Product)
+def update_product_search_index(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    search.index_product(instance)
+
+
+@receiver(post_save, sender=models.Product)
+def update_product_barter_index(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not barter.BARTER_FIELDS.intersection(update_fields):
+        return
+    barter.index_product(instance)
+
+
+@receiver(post_save, sender=models.Category)
+@receiver(post_save, sender=models.Location)
+def reindex_related_products(sender, instance, created=False, update_fields=None, raw=False, **kwargs):
+    if raw or created:
+        return
+    field, indexed_field = ('category', 'name') if sender is models.Category else ('location', 'state')
+    if update_fields is not None and indexed_field not in update_fields:
+        return
+    products = models.Product.objects.filter(**{field: instance}).select_related(
+        'category', 'location').iterator(chunk_size=500)
+    search.index_products(products)
+    if sender is models.Category:
+        barter.index_products(
+            models.Product.objects.filter(category=instance).select_related('category').iterator(chunk_size=500))
+
+
+@receiver(post_save, sender=models.Location)
+@receiver(post_delete, sender=models.Location)
+def invalidate_location_cache(sender, **kwargs):
+    location_cache.invalidate()
+
+
+@receiver(post_save, sender=models.Category)
+@receiver(post_delete, sender=models.Category)
+def invalidate_category_cache(sender, **kwargs):
+    category_cache.invalidate()
+
+
+@receiver(post_save, sender=models.Product)
+@receiver(post_delete, sender=models.Product)
+@receiver(post_save, sender=models.User)
+@receiver(post_delete, sender=models.User)
+@receiver(post_save, sender=models.FlashSale)
+@receiver(post_delete, sender=models.FlashSale)
+def bump_table_version(sender, **kwargs):
+    bump_version(sender._meta.model_name)
+
+
+@receiver(post_save, sender=models.User)
+@receiver(post_delete, sender=models.User)
+def invalidate_cached_user_status(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(USER_STATUS_FIELDS).intersection(update_fields):
+        return
+    invalidate_user_status(instance.pk)
+
+
+@receiver(post_save, sender=models.User)
+def pin_user_to_primary(sender, instance, raw=False, **kwargs):
+    # OTP and profile flows read the row back on the next request
+    if not raw:
+        pin_user(instance.pk)
+
+
+@receiver(post_save, sender=models.Product)
+@receiver(post_save, sender=models.User)
+def generate_image_renditions(sender, instance, created=False, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    if created and not instance.image:
+        return
+    schedule_renditions(instance)
+
+
+FACET_ATTNAMES = ('is_active', 'product_type', 'category_id', 'location_id', 'price')
+
+
+def _loaded_facet_values(instance):
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is None or not all(attname in loaded for attname in FACET_ATTNAMES):
+        return None
+    return {attname: loaded[attname] for attname in FACET_ATTNAMES}
+
+
+@receiver(pre_save, sender=models.Product)
+def remember_facet_values(sender, instance, **kwargs):
+    instance._facet_values_before = {} if instance._state.adding else _loaded_facet_values(instance)
+
+
+@receiver(post_save, sender=models.Product)
+def adjust_facet_counts(sender, instance, created=False, update_fields=None, raw=False, **kwargs):
+    before = getattr(instance, '_facet_values_before', None)
+    if raw or before is None:
+        # the previous values are unknown, recount on the next read
+        facets.invalidate()
+        return
+    after = {attname: getattr(instance, attname) for attname in FACET_ATTNAMES}
+    if update_fields is not None and not created:
+        # columns left out of update_fields keep their stored value
+        saved = {models.Product._meta.get_field(name).attname for name in update_fields}
+        after = {attname: after[attname] if attname in saved else before[attname] for attname in FACET_ATTNAMES}
+    facets.adjust(facets.product_cell(before) if before else None, facets.product_cell(after))
+
+
+@receiver(post_delete, sender=models.Product)
+def remove_from_facet_counts(sender, instance, **kwargs):
+    values = _loaded_facet_values(instance) or vars(instance)
+    facets.adjust(facets.product_cell(values), None)
+
+
+@receiver(post_save, sender=models.Product)
+def notify_interested_users(sender, instance, created=False, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    # the fan-out is queued with the product and run by `send_queued_notifications`
+    if created:
+        notifications.queue_product_notifications(instance, 'new_product')
+        return
+    before = getattr(instance, '_facet_values_before', None)
+    if not before or (update_fields is not None and 'price' not in update_fields):
+        return
+    if instance.price < before['price']:
+        notifications.queue_product_notifications(instance, 'price_drop', old_price=before['price'])
+
+
+@receiver(request_finished)
+def flush_due_engagement(sender, **kwargs):
+    # the flush thread does not run while a serverless process is frozen
+    # between requests, counts older than the interval are written here
+    if engagement_buffer.is_due():
+        engagement_buffer.flush()
+        close_old_connections()
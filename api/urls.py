@@ -4,14 +4,19 @@ from api import views
 
 from rest_framework import routers
 
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
+from api.utils.startup import lazy_view
 
 router = routers.DefaultRouter()
 
 router.register('user', views.UserViewSet, basename='user')
 router.register('product', views.ProductViewSet, basename='product')
+router.register('archived-products', views.ArchivedProductViewSet, basename='archived-product')
 router.register('location', views.LocationViewSet, basename='location')
 router.register('category', views.CategoryViewSet, basename='category')
+router.register('flash-sales', views.FlashSaleViewSet, basename='flash-sale')
+router.register('reservations', views.StockReservationViewSet, basename='reservation')
+router.register('conversations', views.ConversationViewSet, basename='conversation')
+router.register('notifications', views.NotificationViewSet, basename='notification')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -23,8 +28,11 @@ urlpatterns = [
     path('verify-otp/', views.VerifyOTP.as_view(), name='verify_otp'),
     path('confirm-email/', views.ConfirmEmailView.as_view(), name='confirm_email'),
     path('user-verify/', views.UserView.as_view(), name='user'),
+    path('logout/', views.LogoutView.as_view(), name='logout'),
+    path('logout-all/', views.LogoutAllView.as_view(), name='logout_all'),
+    path('cache-stats/', views.CacheStatsView.as_view(), name='cache_stats'),
 
-    path('schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-	path('schema/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    path('schema/', views.SchemaView.as_view(), name='schema'),
+    path('docs/', lazy_view('drf_spectacular.views.SpectacularSwaggerView', url_name='schema'), name='swagger-ui'),
+    path('schema/redoc/', lazy_view('drf_spectacular.views.SpectacularRedocView', url_name='schema'), name='redoc'),
 ]
\ No newline at end of file
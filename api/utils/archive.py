@@ -0,0 +1,121 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+
+from api.utils import barter, facets, search
+from api.utils.caching import bump_version
+
+
+def get_batch_size():
+    return getattr(settings, 'PRODUCT_ARCHIVE_BATCH_SIZE', 500)
+
+
+def _column_values(instance, model):
+    values = {}
+    for field in model._meta.concrete_fields:
+        value = getattr(instance, field.attname)
+        # the file stays where it is, only its name moves
+        values[field.attname] = value.name if isinstance(value, FieldFile) else value
+    return values
+
+
+def archivable_products(now=None, inactive_days=None, max_age_days=None):
+    """
+    Products due for the archive: inactive ones not updated for
+    PRODUCT_ARCHIVE_INACTIVE_DAYS and any not updated for
+    PRODUCT_ARCHIVE_MAX_AGE_DAYS. Products with conversations or flash sales
+    stay, those rows would be deleted with them.
+    """
+    from api.models import Conversation, FlashSale, Product
+
+    now = now or timezone.now()
+    if inactive_days is None:
+        inactive_days = getattr(settings, 'PRODUCT_ARCHIVE_INACTIVE_DAYS', 30)
+    if max_age_days is None:
+        max_age_days = getattr(settings, 'PRODUCT_ARCHIVE_MAX_AGE_DAYS', None)
+
+    condition = Q(is_active=False, updated_at__lt=now - timedelta(days=inactive_days))
+    if max_age_days is not None:
+        condition |= Q(updated_at__lt=now - timedelta(days=max_age_days))
+    return Product.objects.filter(condition).exclude(
+        Exists(Conversation.objects.filter(product=OuterRef('pk'))),
+    ).exclude(
+        Exists(FlashSale.objects.filter(product=OuterRef('pk'))),
+    )
+
+
+def archive_products(batch_size=None, now=None, **cutoffs):
+    """
+    Moves archivable products to `ArchivedProduct` a batch per transaction,
+    so no lock is held for longer than one batch. Rows another transaction
+    holds are skipped and picked up by the next run. Their search and barter
+    tokens and engagement counters are dropped, restoring rebuilds the
+    tokens. Returns how many products were archived.
+    """
+    from api.models import ArchivedProduct, Product
+
+    batch_size = batch_size or get_batch_size()
+    now = now or timezone.now()
+    total = 0
+    while True:
+        with transaction.atomic():
+            products = list(
+                archivable_products(now, **cutoffs).select_for_update(skip_locked=True)
+                .order_by('pk')[:batch_size]
+            )
+            if products:
+                ArchivedProduct.objects.bulk_create([
+                    ArchivedProduct(archived_at=now, **_column_values(product, Product)) for product in products
+                ])
+                # a plain delete, so the facet counts and versions follow through the signals
+                Product.objects.filter(pk__in=[product.pk for product in products]).delete()
+        total += len(products)
+        if len(products) < batch_size:
+            return total
+
+
+def visible_archived_products(user):
+    """Owners see their own archived products, admins all of them."""
+    from api.models import ArchivedProduct
+
+    queryset = ArchivedProduct.objects.all()
+    if not user.is_staff:
+        queryset = queryset.filter(user_id=user.pk)
+    return queryset
+
+
+def restore_products(ids):
+    """
+    Moves the archived products among `ids` back to the live table under
+    their old ids and reindexes them. Returns the restored products, ids
+    already restored by someone else are left out.
+    """
+    from api.models import ArchivedProduct, Product
+
+    with transaction.atomic():
+        archived = list(
+            ArchivedProduct.objects.select_for_update().filter(pk__in=ids).select_related('category', 'location')
+        )
+        if not archived:
+            return []
+
+        products = []
+        for row in archived:
+            values = _column_values(row, Product)
+            # bulk_create stamps updated_at, so a restored product is not archived again right away
+            product = Product(**values)
+            product.category = row.category
+            product.location = row.location
+            products.append(product)
+
+        Product.objects.bulk_create(products)
+        ArchivedProduct.objects.filter(pk__in=[row.pk for row in archived]).delete()
+        search.index_products(products)
+        barter.index_products(products)
+        facets.adjust_many(facets.product_cell(vars(product)) for product in products)
+    bump_version('product')
+    return products
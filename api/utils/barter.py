@@ -0,0 +1,204 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from api.utils.search import tokenize
+
+
+# weight of a "have" token depending on the product field it was found in
+HAVE_WEIGHTS = {
+    'name': 2,
+    'category': 1,
+}
+
+MAX_MATCHES = 50
+# how many one-way candidates on each side are considered when looking for cycles
+CYCLE_CANDIDATES = 100
+
+# fields of a product the barter index is built from
+BARTER_FIELDS = {'name', 'exchange', 'category', 'is_active'}
+
+
+def want_tokens(product):
+    return {token: 1 for token in tokenize(product.exchange)}
+
+
+def have_tokens(product):
+    weights = {}
+    for field, text in (('name', product.name), ('category', product.category.name)):
+        for token in tokenize(text):
+            weights[token] = weights.get(token, 0) + HAVE_WEIGHTS[field]
+    return weights
+
+
+def build_barter_rows(product):
+    from api.models import BarterToken
+
+    # inactive products are not offered to anyone and do not look for matches
+    if not product.is_active:
+        return []
+    rows = [
+        BarterToken(product_id=product.pk, kind='have', token=token, weight=weight)
+        for token, weight in have_tokens(product).items()
+    ]
+    rows.extend(
+        BarterToken(product_id=product.pk, kind='want', token=token, weight=weight)
+        for token, weight in want_tokens(product).items()
+    )
+    return rows
+
+
+def index_product(product):
+    from api.models import BarterToken
+
+    with transaction.atomic():
+        BarterToken.objects.filter(product_id=product.pk).delete()
+        BarterToken.objects.bulk_create(build_barter_rows(product))
+
+
+def index_products(products, batch_size=500):
+    """
+    Reindexes many products, `products` should have category selected to
+    avoid a query per row.
+    """
+    from api.models import BarterToken
+
+    batch = []
+    count = 0
+    for product in products:
+        batch.append(product)
+        if len(batch) >= batch_size:
+            count += _index_batch(BarterToken, batch)
+            batch = []
+    if batch:
+        count += _index_batch(BarterToken, batch)
+    return count
+
+
+def _index_batch(model, products):
+    rows = []
+    for product in products:
+        rows.extend(build_barter_rows(product))
+    with transaction.atomic():
+        model.objects.filter(product_id__in=[p.pk for p in products]).delete()
+        model.objects.bulk_create(rows)
+    return len(products)
+
+
+def _token_rows(kind, tokens, exclude_user):
+    from api.models import BarterToken
+
+    return BarterToken.objects.filter(kind=kind, token__in=list(tokens)).exclude(product__user_id=exclude_user)
+
+
+def find_offers(product, wants):
+    """
+    {product id: (score, tokens)} of other users' products that have what
+    `product` wants.
+    """
+    offers = {}
+    rows = _token_rows('have', wants, product.user_id).values_list('product_id', 'token', 'weight')
+    for product_id, token, weight in rows:
+        score, tokens = offers.get(product_id, (0, []))
+        offers[product_id] = (score + weight, tokens + [token])
+    return offers
+
+
+def find_seekers(product, haves):
+    """
+    {product id: (score, tokens)} of other users' products that want what
+    `product` has, scored with the weights of `product`'s own tokens.
+    """
+    seekers = {}
+    rows = _token_rows('want', haves, product.user_id).values_list('product_id', 'token')
+    for product_id, token in rows:
+        score, tokens = seekers.get(product_id, (0, []))
+        seekers[product_id] = (score + haves[token], tokens + [token])
+    return seekers
+
+
+def _top(scored, limit):
+    return sorted(scored, key=lambda pk: (-scored[pk][0], pk))[:limit]
+
+
+def find_cycles(product, offers, seekers, limit):
+    """
+    Three-way trades: `product` gets from B, B gets from C and C gets from
+    `product`. B comes from `offers`, C from `seekers`, only the tokens of
+    those candidates are read.
+    """
+    from api.models import BarterToken, Product
+
+    givers = _top(offers, CYCLE_CANDIDATES)
+    takers = _top(seekers, CYCLE_CANDIDATES)
+    if not givers or not takers:
+        return []
+
+    owners = dict(Product.objects.filter(pk__in=set(givers) | set(takers)).values_list('pk', 'user_id'))
+    giver_wants = defaultdict(set)
+    for product_id, token in BarterToken.objects.filter(
+            kind='want', product_id__in=givers).values_list('product_id', 'token'):
+        giver_wants[token].add(product_id)
+    if not giver_wants:
+        return []
+
+    links = defaultdict(int)
+    for product_id, token, weight in BarterToken.objects.filter(
+            kind='have', product_id__in=takers, token__in=list(giver_wants)).values_list(
+            'product_id', 'token', 'weight'):
+        for giver in giver_wants[token]:
+            links[giver, product_id] += weight
+
+    cycles = []
+    for (giver, taker), score in links.items():
+        # three different people, otherwise it is not a cycle
+        if giver == taker or owners.get(giver) == owners.get(taker):
+            continue
+        cycles.append((offers[giver][0] + score + seekers[taker][0], giver, taker))
+    cycles.sort(key=lambda cycle: (-cycle[0], cycle[1], cycle[2]))
+    return cycles[:limit]
+
+
+def find_matches(product, limit=20, cycles=False):
+    """
+    Ranked barter matches for `product`. Two-way matches are products that
+    have what `product` wants and want what it has, scored by the summed
+    token weights on both sides.
+    """
+    from api.models import Product
+
+    limit = min(limit, MAX_MATCHES)
+    wants = want_tokens(product)
+    haves = have_tokens(product)
+    if not wants or not haves or not product.is_active:
+        return {'two_way': [], 'three_way': []}
+
+    offers = find_offers(product, wants)
+    seekers = find_seekers(product, haves)
+
+    two_way = sorted(
+        ((offers[pk][0] + seekers[pk][0], pk) for pk in offers.keys() & seekers.keys()),
+        key=lambda match: (-match[0], match[1]),
+    )[:limit]
+    three_way = find_cycles(product, offers, seekers, limit) if cycles else []
+
+    ids = {pk for _, pk in two_way}
+    for _, giver, taker in three_way:
+        ids.update((giver, taker))
+    products = Product.objects.filter(pk__in=ids, is_active=True).in_bulk()
+
+    return {
+        'two_way': [
+            {
+                'score': score,
+                'product': products[pk],
+                'receives': offers[pk][1],
+                'gives': seekers[pk][1],
+            }
+            for score, pk in two_way if pk in products
+        ],
+        'three_way': [
+            {'score': score, 'products': [products[giver], products[taker]]}
+            for score, giver, taker in three_way if giver in products and taker in products
+        ],
+    }
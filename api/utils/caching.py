@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from api.utils.db_routing import primary_reads
+
+
+# backends whose entries live in one process, what one worker sets or deletes never reaches another
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_is_shared():
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+def _version_key(name):
+    return f'version:{name}'
+
+
+def get_version(name):
+    """
+    Returns the change version of a table, versions are creation timestamps
+    so a flushed cache can never hand out a version that was already used.
+    """
+    version = cache.get(_version_key(name))
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(_version_key(name), version, None):
+            version = cache.get(_version_key(name), version)
+    return version
+
+
+def get_versions(names):
+    keys = {_version_key(name): name for name in names}
+    found = cache.get_many(keys)
+    return {
+        name: found[key] if key in found else get_version(name)
+        for key, name in keys.items()
+    }
+
+
+def bump_version(name):
+    version = time.time_ns()
+    cache.set(_version_key(name), version, None)
+    return version
+
+
+class ReferenceDataCache:
+    """
+    Two tier cache for rarely changing reference data: a process local dict in
+    front of the shared Django cache, both keyed by the table version so a
+    version bump invalidates every worker at once. The local dict keeps the
+    REFERENCE_CACHE_LOCAL_MAX_ENTRIES most recently used keys.
+    """
+
+    def __init__(self, name, timeout=None, max_entries=None):
+        self.name = name
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.local = OrderedDict()
+        self.local_version = None
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get_timeout(self):
+        if self.timeout is not None:
+            return self.timeout
+        return getattr(settings, 'REFERENCE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+    def get_max_entries(self):
+        if self.max_entries is not None:
+            return self.max_entries
+        return getattr(settings, 'REFERENCE_CACHE_LOCAL_MAX_ENTRIES', 256)
+
+    def get_or_set(self, key, builder):
+        version = get_version(self.name)
+        with self.lock:
+            if self.local_version != version:
+                self.local = OrderedDict()
+                self.local_version = version
+            elif key in self.local:
+                self.local_hits += 1
+                self.local.move_to_end(key)
+                return self.local[key]
+
+        shared_key = f'refdata:{self.name}:{version}:{key}'
+        value = cache.get(shared_key)
+        if value is None:
+            with primary_reads():
+                value = builder()
+            cache.set(shared_key, value, self.get_timeout())
+            hit = False
+        else:
+            hit = True
+
+        with self.lock:
+            if hit:
+                self.shared_hits += 1
+            else:
+                self.misses += 1
+            if self.local_version == version:
+                self.local[key] = value
+                while len(self.local) > self.get_max_entries():
+                    self.local.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        bump_version(self.name)
+        with self.lock:
+            self.local = OrderedDict()
+            self.local_version = None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'name': self.name,
+                'local_hits': self.local_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'local_entries': len(self.local),
+            }
+
+
+location_cache = ReferenceDataCache('location')
+category_cache = ReferenceDataCache('category')
+
+REFERENCE_CACHES = [location_cache, category_cache]
+
+
+class CachedReferenceMixin:
+    """
+    Serves list and retrieve from `reference_cache`, the cache key covers the
+    host, path and the search, ordering and pagination params so their
+    variants are stored separately. Other params do not change the response
+    and are left out of the key.
+    """
+    reference_cache = None
+
+    def get_reference_cache_params(self):
+        params = {api_settings.SEARCH_PARAM, api_settings.ORDERING_PARAM}
+        for name in ('limit_query_param', 'offset_query_param', 'page_query_param', 'page_size_query_param',
+                     'cursor_query_param', 'mode_query_param', 'count_query_param'):
+            value = getattr(self.paginator, name, None)
+            if value:
+                params.add(value)
+        return params
+
+    def get_reference_cache_key(self, request, action):
+        query = '&'.join(
+            f'{name}={request.query_params[name]}'
+            for name in sorted(self.get_reference_cache_params()) if name in request.query_params
+        )
+        return f'{action}:{request.get_host()}{request.path}?{query}'
+
+    def list(self, request, *args, **kwargs):
+        key = self.get_reference_cache_key(request, 'list')
+        data = self.reference_cache.get_or_set(
+            key, lambda: super(CachedReferenceMixin, self).list(request, *args, **kwargs).data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        key = self.get_reference_cache_key(request, 'retrieve')
+        data = self.reference_cache.get_or_set(
+            key, lambda: super(CachedReferenceMixin, self).retrieve(request, *args, **kwargs).data)
+        return Response(data)
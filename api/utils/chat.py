@@ -0,0 +1,243 @@
+import asyncio
+import functools
+import json
+import threading
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import AuthenticationFailed
+
+from api.utils.notifications import notify_users
+
+
+CHAT_PATH = '/ws/chat/'
+# websocket close codes, 4000-4999 are free for applications
+CLOSE_NOT_FOUND = 4404
+CLOSE_UNAUTHORIZED = 4401
+
+
+def user_group(user_id):
+    return f'chat.user.{user_id}'
+
+
+class Subscription:
+    def __init__(self, loop, size):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=size)
+
+    def deliver(self, event):
+        # runs on the subscriber's loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # a client this far behind refetches the history instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({'type': 'resync'})
+
+
+class InMemoryChannelLayer:
+    """
+    Process local pub/sub. `publish` can be called from any thread, events
+    are handed to the event loop of each subscriber. A shared broker only
+    has to provide the same `subscribe`, `unsubscribe` and `publish`.
+    """
+
+    def __init__(self):
+        self.groups = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, group):
+        subscription = Subscription(asyncio.get_running_loop(), getattr(settings, 'CHAT_QUEUE_SIZE', 100))
+        with self.lock:
+            self.groups[group].add(subscription)
+        return subscription
+
+    def unsubscribe(self, group, subscription):
+        with self.lock:
+            subscribers = self.groups.get(group)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.groups[group]
+
+    def publish(self, group, event):
+        with self.lock:
+            subscribers = list(self.groups.get(group, ()))
+        delivered = 0
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+                delivered += 1
+            except RuntimeError:
+                # the loop is closed, the socket went away without unsubscribing
+                self.unsubscribe(group, subscription)
+        return delivered
+
+    def subscription_count(self):
+        with self.lock:
+            return sum(len(subscribers) for subscribers in self.groups.values())
+
+
+_channel_layer = None
+_channel_layer_lock = threading.Lock()
+
+
+def get_channel_layer():
+    global _channel_layer
+    with _channel_layer_lock:
+        if _channel_layer is None:
+            _channel_layer = import_string(
+                getattr(settings, 'CHAT_CHANNEL_LAYER', 'api.utils.chat.InMemoryChannelLayer'))()
+        return _channel_layer
+
+
+def start_conversation(product, buyer_id):
+    from api.models import Conversation
+
+    return Conversation.objects.get_or_create(
+        product=product, buyer_id=buyer_id, defaults={'seller_id': product.user_id})
+
+
+def send_message(conversation, sender_id, body):
+    """
+    Saves the message, notifies the other side and pushes it to the open
+    sockets of both sides once the transaction commits.
+    """
+    from api.models import Conversation, Message
+    from api.serializers import MessageSerializer
+
+    recipient_id = conversation.seller_id if sender_id == conversation.buyer_id else conversation.buyer_id
+    with transaction.atomic():
+        message = Message.objects.create(conversation=conversation, sender_id=sender_id, body=body)
+        Conversation.objects.filter(pk=conversation.pk).update(last_message_at=message.created_at)
+        notify_users(
+            [recipient_id], kind='message', title='New message', body=body[:100],
+            data={'conversation': conversation.pk, 'message': message.pk})
+
+        event = {'type': 'message', 'message': MessageSerializer(message).data}
+        transaction.on_commit(lambda: publish_to_users([sender_id, recipient_id], event))
+    return message
+
+
+def publish_to_users(user_ids, event):
+    layer = get_channel_layer()
+    return sum(layer.publish(user_group(user_id), event) for user_id in user_ids)
+
+
+def database_sync_to_async(func):
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        # there is no request around a socket to clean up connections for us
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(inner)
+
+
+@database_sync_to_async
+def authenticate(raw_token):
+    from api.utils.perms_and_auth import CachedJWTAuthentication
+
+    authentication = CachedJWTAuthentication()
+    try:
+        user = authentication.get_user(authentication.get_validated_token(raw_token))
+    except AuthenticationFailed:
+        return None
+    if user.is_suspended or not user.email_confirmed:
+        return None
+    return user
+
+
+@database_sync_to_async
+def post_message(user_id, data):
+    from api.models import Conversation
+    from api.serializers import MessageSerializer
+
+    conversation = None
+    try:
+        conversation = Conversation.objects.filter(
+            Q(buyer_id=user_id) | Q(seller_id=user_id), pk=int(data.get('conversation'))).first()
+    except (TypeError, ValueError):
+        pass
+    if conversation is None:
+        return {'type': 'error', 'ref': data.get('ref'), 'detail': 'Conversation not found'}
+    serializer = MessageSerializer(data={'body': data.get('body')})
+    if not serializer.is_valid():
+        return {'type': 'error', 'ref': data.get('ref'), 'detail': serializer.errors}
+    message = send_message(conversation, user_id, serializer.validated_data['body'])
+    return {'type': 'ack', 'ref': data.get('ref'), 'message': message.pk}
+
+
+def get_raw_token(scope):
+    tokens = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('token')
+    if tokens:
+        return tokens[0]
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.decode('latin-1').split()
+            if len(parts) == 2 and parts[0].lower() == 'bearer':
+                return parts[1]
+    return None
+
+
+async def send_json(send, data):
+    await send({'type': 'websocket.send', 'text': json.dumps(data, separators=(',', ':'))})
+
+
+async def forward_events(subscription, send):
+    while True:
+        await send_json(send, await subscription.queue.get())
+
+
+async def websocket_application(scope, receive, send):
+    """
+    `/ws/chat/?token=<access token>`: pushes `message` events for every
+    conversation of the user and takes `{"conversation", "body", "ref"}` to
+    send one. An idle socket is a queue and two waiting coroutines, no
+    thread or database connection is held.
+    """
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+    if scope['path'] != CHAT_PATH:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+
+    raw_token = get_raw_token(scope)
+    user = await authenticate(raw_token) if raw_token else None
+    if user is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        return
+    await send({'type': 'websocket.accept'})
+
+    layer = get_channel_layer()
+    group = user_group(user.pk)
+    subscription = layer.subscribe(group)
+    forwarder = asyncio.create_task(forward_events(subscription, send))
+    try:
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                break
+            if event['type'] != 'websocket.receive':
+                continue
+            try:
+                data = json.loads(event.get('text') or event.get('bytes') or '')
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                await send_json(send, {'type': 'error', 'detail': 'Expected a JSON object'})
+                continue
+            await send_json(send, await post_message(user.pk, data))
+    finally:
+        layer.unsubscribe(group, subscription)
+        forwarder.cancel()
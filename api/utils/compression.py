@@ -0,0 +1,114 @@
+import gzip
+import re
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - only gzip is offered then
+    brotli = None
+
+
+# content that is compressed already or not worth compressing
+SKIP_CONTENT_TYPES = ('image/', 'video/', 'audio/', 'application/gzip', 'application/zip', 'font/woff')
+
+_accept_re = re.compile(r'\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?')
+
+
+def accepted_encodings(header):
+    """
+    Returns {coding: q} from an Accept-Encoding header.
+    """
+    encodings = {}
+    for part in (header or '').split(','):
+        match = _accept_re.match(part)
+        if not match:
+            continue
+        try:
+            quality = float(match.group(2)) if match.group(2) else 1.0
+        except ValueError:
+            continue
+        encodings[match.group(1).lower()] = quality
+    return encodings
+
+
+def choose_encoding(header):
+    encodings = accepted_encodings(header)
+    offered = (['br'] if brotli is not None else []) + ['gzip']
+    wildcard = encodings.get('*', 0)
+    ranked = [(encodings.get(coding, wildcard), -index, coding) for index, coding in enumerate(offered)]
+    quality, _, coding = max(ranked)
+    return coding if quality > 0 else None
+
+
+def compress(content, coding):
+    if coding == 'br':
+        return brotli.compress(content, quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4))
+    return gzip.compress(content, compresslevel=getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6), mtime=0)
+
+
+def compress_stream(chunks, coding):
+    if coding == 'br':
+        compressor = brotli.Compressor(quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4))
+        for chunk in chunks:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+        return
+
+    compressor = zlib.compressobj(getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6), zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class CompressionMiddleware:
+    """
+    Brotli or gzip response compression negotiated from Accept-Encoding,
+    responses under COMPRESSION_MIN_SIZE bytes are sent as they are.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if response.status_code in (204, 206, 304) or response.has_header('Content-Encoding'):
+            return response
+        if response.get('Content-Type', '').startswith(SKIP_CONTENT_TYPES):
+            return response
+        min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        if response.streaming and getattr(response, 'is_async', False):
+            return response
+        if not response.streaming and len(response.content) < min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        coding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if coding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(response.streaming_content, coding)
+            del response['Content-Length']
+        else:
+            compressed = compress(response.content, coding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # the body differs byte for byte, so the validator becomes weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = coding
+        return response
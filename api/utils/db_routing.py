@@ -0,0 +1,127 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'db_pin'
+
+_routing = ContextVar('db_routing', default=None)
+_primary_reads = ContextVar('db_primary_reads', default=False)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def get_pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def _user_pin_key(user_id):
+    return f'db-pin:user:{user_id}'
+
+
+def pin_user(user_id):
+    """
+    Sends the user's requests to the primary for the next few seconds, so
+    they read their own change even where the replicas lag behind.
+    """
+    if not get_replicas():
+        return
+    cache.set(_user_pin_key(user_id), True, get_pin_seconds())
+
+
+@contextmanager
+def primary_reads():
+    """
+    Reads in the block go to the primary. For filling caches that outlive
+    the replica lag, a fill from a lagging replica would be served stale
+    until the next invalidation.
+    """
+    token = _primary_reads.set(True)
+    try:
+        yield
+    finally:
+        _primary_reads.reset(token)
+
+
+class RequestRouting:
+    def __init__(self, request, replica_reads):
+        self.request = request
+        self.replica_reads = replica_reads
+        self.wrote = False
+        self.user_checked = False
+
+    def use_replica(self):
+        if not self.replica_reads or self.wrote:
+            return False
+        if not self.user_checked:
+            # DRF puts the authenticated user on the request once it is known. Only
+            # an id that is already there is used, evaluating a lazy user would
+            # itself query the database
+            user = self.request.__dict__.get('user')
+            user_id = user.__dict__.get('id') if user is not None else None
+            if user_id is not None:
+                self.user_checked = True
+                if cache.get(_user_pin_key(user_id)):
+                    self.replica_reads = False
+        return self.replica_reads
+
+
+class ReplicaRouter:
+    """
+    Reads of safe-method requests go to a random replica. Everything else
+    stays on the primary: writes, reads inside a transaction or a
+    `primary_reads()` block, reads after the request wrote, requests of a
+    client or user that wrote in the last REPLICA_PIN_SECONDS, and anything
+    outside a request (commands, signals run by jobs, background threads).
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        replicas = get_replicas()
+        if routing is None or not replicas or _primary_reads.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if not routing.use_replica():
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Marks which requests may read from a replica. A request that wrote
+    leaves a short lived cookie so the same client keeps reading from the
+    primary until the replicas caught up.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routing = RequestRouting(
+            request, replica_reads=request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES)
+        token = _routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        if routing.wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age=get_pin_seconds(), httponly=True, samesite='Lax')
+        return response
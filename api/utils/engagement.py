@@ -0,0 +1,195 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+ENGAGEMENT_FIELDS = ('views', 'contacts')
+RANKING_KEY = 'hot-deals:ranking'
+# scores below this have decayed to nothing and are zeroed, which keeps them out of the job
+MIN_SCORE = 0.01
+
+
+def write_counts(counts):
+    """
+    Adds {(product id, field): amount} to the engagement rows. Missing rows
+    are created with one INSERT, the counters are raised with one UPDATE per
+    distinct (field, amount), never one per product.
+    """
+    from api.models import Product, ProductEngagement
+
+    product_ids = {product_id for product_id, _ in counts}
+    # products deleted since they were counted are skipped
+    existing = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+    groups = defaultdict(list)
+    for (product_id, field), amount in counts.items():
+        if product_id in existing:
+            groups[field, amount].append(product_id)
+
+    with transaction.atomic():
+        ProductEngagement.objects.bulk_create(
+            [ProductEngagement(product_id=product_id) for product_id in existing], ignore_conflicts=True)
+        for (field, amount), ids in groups.items():
+            ProductEngagement.objects.filter(pk__in=ids).update(**{field: F(field) + amount})
+
+
+class EngagementBuffer:
+    """
+    Counts views and contacts in process. A background thread writes them
+    every ENGAGEMENT_FLUSH_INTERVAL seconds, or sooner once many products
+    are pending, so recording one never touches the database. Where the
+    thread cannot be relied on, a process frozen between requests on a
+    serverless host, the end of each request also flushes counts older
+    than the interval, see `is_due`.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.pending_since = None
+
+    def get_interval(self):
+        return getattr(settings, 'ENGAGEMENT_FLUSH_INTERVAL', 10)
+
+    def record(self, product_id, field='views', amount=1):
+        with self.lock:
+            if not self.counts:
+                self.pending_since = time.monotonic()
+            self.counts[product_id, field] += amount
+            if len(self.counts) >= getattr(settings, 'ENGAGEMENT_BUFFER_MAX_KEYS', 10000):
+                self.wake.set()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='engagement-flush', daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def drain(self):
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+            self.pending_since = None
+        return counts
+
+    def is_due(self):
+        pending_since = self.pending_since
+        return pending_since is not None and time.monotonic() - pending_since >= self.get_interval()
+
+    def flush(self):
+        counts = self.drain()
+        if not counts:
+            return 0
+        try:
+            write_counts(counts)
+        except Exception:
+            logger.exception('Could not write %s engagement counters', len(counts))
+            # put them back for the next flush
+            with self.lock:
+                if not self.counts:
+                    self.pending_since = time.monotonic()
+                self.counts.update(counts)
+            return 0
+        return len(counts)
+
+    def run(self):
+        while True:
+            self.wake.wait(self.get_interval())
+            self.wake.clear()
+            try:
+                self.flush()
+            finally:
+                connection.close()
+
+
+engagement_buffer = EngagementBuffer()
+
+
+def record_view(product_id):
+    engagement_buffer.record(product_id, 'views')
+
+
+def record_contact(product_id):
+    engagement_buffer.record(product_id, 'contacts')
+
+
+def update_trending_scores(now=None):
+    """
+    Brings every score up to `now` in one UPDATE: what it was at the last
+    run, decayed by the time since, plus the weighted counts that came in
+    since. Only products with a score or new counts are touched, the rest
+    of the catalog is never read. Returns how many scores changed.
+    """
+    from api.models import ProductEngagement
+
+    now = now or timezone.now()
+    last_run = ProductEngagement.objects.aggregate(last_run=Max('scored_at'))['last_run']
+    decay = 1.0
+    if last_run is not None:
+        elapsed = max((now - last_run).total_seconds(), 0)
+        decay = 0.5 ** (elapsed / getattr(settings, 'TRENDING_HALF_LIFE', 60 * 60 * 24))
+    weights = getattr(settings, 'TRENDING_WEIGHTS', {'views': 1, 'contacts': 5})
+
+    with transaction.atomic():
+        updated = ProductEngagement.objects.filter(
+            Q(score__gt=0) | ~Q(views=F('scored_views')) | ~Q(contacts=F('scored_contacts')),
+        ).update(
+            score=(F('score') * decay
+                   + (F('views') - F('scored_views')) * weights['views']
+                   + (F('contacts') - F('scored_contacts')) * weights['contacts']),
+            scored_views=F('views'),
+            scored_contacts=F('contacts'),
+            scored_at=now,
+        )
+        ProductEngagement.objects.filter(score__gt=0, score__lt=MIN_SCORE).update(score=0)
+    refresh_ranking()
+    return updated
+
+
+def build_ranking():
+    from api.models import ProductEngagement
+
+    return list(ProductEngagement.objects.filter(
+        score__gt=0, product__is_active=True,
+    ).order_by('-score', 'product_id').values_list(
+        'product_id', 'score', 'product__category_id', 'product__location_id',
+    )[:getattr(settings, 'HOT_DEALS_RANKING_SIZE', 1000)])
+
+
+def refresh_ranking():
+    ranking = build_ranking()
+    cache.set(RANKING_KEY, ranking, getattr(settings, 'HOT_DEALS_CACHE_TIMEOUT', 60 * 60))
+    return ranking
+
+
+def get_ranking():
+    ranking = cache.get(RANKING_KEY)
+    if ranking is None:
+        ranking = refresh_ranking()
+    return ranking
+
+
+def hot_products(category=None, location=None, limit=20):
+    """
+    The top of the cached ranking, optionally for one category and/or
+    location, as [{'score', 'product'}].
+    """
+    from api.models import Product
+
+    picked = [
+        (product_id, score) for product_id, score, category_id, location_id in get_ranking()
+        if (category is None or category_id == category) and (location is None or location_id == location)
+    ][:limit]
+    products = Product.objects.filter(pk__in=[product_id for product_id, _ in picked], is_active=True).in_bulk()
+    return [
+        {'score': score, 'product': products[product_id]}
+        for product_id, score in picked if product_id in products
+    ]
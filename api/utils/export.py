@@ -0,0 +1,80 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+
+from api.utils.compression import compress_stream
+
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+PRODUCT_EXPORT_FIELDS = [
+    'id', 'user', 'name', 'description', 'price', 'exchange', 'product_type',
+    'category', 'location', 'image', 'is_active', 'created_at', 'updated_at',
+]
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows, fields):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([row[field] for field in fields])
+
+
+def iter_jsonl(rows, fields):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def iter_chunks(lines, chunk_size=64 * 1024):
+    """Groups text lines into utf-8 chunks of about `chunk_size` bytes."""
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def iter_export(queryset, fields=None, file_format='csv', chunk_size=2000, compress=False):
+    """
+    Streams a queryset as CSV or JSONL bytes. Rows come from `values()` read
+    through a server side cursor, lines are grouped into chunks of about 64KB
+    and optionally gzipped on the fly.
+    """
+    fields = fields or PRODUCT_EXPORT_FIELDS
+    rows = queryset.values(*fields).iterator(chunk_size=chunk_size)
+    lines = iter_csv(rows, fields) if file_format == 'csv' else iter_jsonl(rows, fields)
+    chunks = iter_chunks(lines)
+    return compress_stream(chunks, 'gzip') if compress else chunks
+
+
+def export_filename(basename, file_format, compress):
+    return f"{basename}.{file_format}{'.gz' if compress else ''}"
+
+
+class ExportContentNegotiation(DefaultContentNegotiation):
+    """
+    Export responses are not rendered by DRF, so an `Accept: text/csv` header
+    must not fail content negotiation.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            return renderers[0], renderers[0].media_type
@@ -0,0 +1,181 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+from api.utils.caching import bump_version, category_cache, get_version, location_cache
+from api.utils.db_routing import primary_reads
+
+
+# (label, lower bound, upper bound), bounds are inclusive/exclusive, None is open
+PRICE_BUCKETS = [
+    ('free', 0, 1),
+    ('under_10k', 1, 10_000),
+    ('10k_50k', 10_000, 50_000),
+    ('50k_200k', 50_000, 200_000),
+    ('200k_1m', 200_000, 1_000_000),
+    ('over_1m', 1_000_000, None),
+]
+
+FACET_FIELDS = ('product_type', 'category', 'location')
+# query params that do not narrow the result set
+NON_FILTER_PARAMS = {'ordering', 'limit', 'offset', 'cursor', 'pagination', 'count', 'format'}
+
+CUBE_KEY = 'facets:product-cube'
+VERSION_NAME = 'facets'
+
+
+def price_bucket(price):
+    price = Decimal(price or 0)
+    for index, (_, lower, upper) in enumerate(PRICE_BUCKETS):
+        if price >= lower and (upper is None or price < upper):
+            return index
+    return 0
+
+
+def price_bucket_expression():
+    whens = []
+    for index, (_, lower, upper) in enumerate(PRICE_BUCKETS):
+        condition = Q(price__gte=lower)
+        if upper is not None:
+            condition &= Q(price__lt=upper)
+        whens.append(When(condition, then=Value(index)))
+    return Case(*whens, default=Value(0), output_field=IntegerField())
+
+
+def product_cell(values):
+    """
+    The cube cell of a product from its field values, None for inactive
+    products which are not counted.
+    """
+    if not values.get('is_active'):
+        return None
+    return (values['product_type'], values['category_id'], values['location_id'], price_bucket(values['price']))
+
+
+def build_cube(queryset):
+    """
+    Counts of `queryset` per (product_type, category, location, price bucket)
+    in a single GROUP BY, every facet is a sum over these cells.
+    """
+    rows = queryset.order_by().annotate(bucket=price_bucket_expression()).values(
+        'product_type', 'category_id', 'location_id', 'bucket').annotate(count=Count('pk'))
+    cube = {}
+    for row in rows.values_list('product_type', 'category_id', 'location_id', 'bucket', 'count'):
+        cube[row[:4]] = row[4]
+    return cube
+
+
+def get_timeout():
+    return getattr(settings, 'FACET_CACHE_TIMEOUT', 60 * 10)
+
+
+def get_cube_key():
+    return f'{CUBE_KEY}:{get_version(VERSION_NAME)}'
+
+
+def get_catalog_cube():
+    from api.models import Product
+
+    # versioned, a cube built from rows read before an invalidation is stored
+    # under the old version and never served
+    key = get_cube_key()
+    cube = cache.get(key)
+    if cube is None:
+        with primary_reads():
+            cube = build_cube(Product.objects.filter(is_active=True))
+        cache.add(key, cube, get_timeout())
+    return cube
+
+
+def adjust(old_cell, new_cell):
+    """
+    Called when a product moves between cells. The cached cube is dropped
+    once the transaction commits and rebuilt by the next read; patching it
+    in place would be a read-modify-write that concurrent workers overwrite.
+    Saves that leave the product in its cell keep the cube.
+    """
+    if old_cell == new_cell:
+        return
+    invalidate()
+
+
+def adjust_many(cells):
+    if any(cell is not None for cell in cells):
+        invalidate()
+
+
+def invalidate():
+    transaction.on_commit(lambda: bump_version(VERSION_NAME))
+
+
+def filter_cube(cube, filters):
+    """
+    `filters` maps a facet field to the allowed values as strings.
+    """
+    if not filters:
+        return cube
+    positions = {field: FACET_FIELDS.index(field) for field in filters}
+    return {
+        cell: count for cell, count in cube.items()
+        if all(str(cell[positions[field]]) in values for field, values in filters.items())
+    }
+
+
+def get_labels():
+    from api.models import Category, Location
+
+    return {
+        'category': category_cache.get_or_set(
+            'facet-labels', lambda: dict(Category.objects.values_list('pk', 'name'))),
+        'location': location_cache.get_or_set(
+            'facet-labels', lambda: dict(Location.objects.values_list('pk', 'state'))),
+    }
+
+
+def summarize(cube):
+    totals = {field: {} for field in FACET_FIELDS}
+    prices = [0] * len(PRICE_BUCKETS)
+    for cell, count in cube.items():
+        for position, field in enumerate(FACET_FIELDS):
+            totals[field][cell[position]] = totals[field].get(cell[position], 0) + count
+        prices[cell[3]] += count
+
+    names = get_labels()
+
+    def facet(field):
+        return [
+            {'value': value, 'label': names[field].get(value, value) if field in names else value, 'count': count}
+            for value, count in sorted(totals[field].items(), key=lambda item: (-item[1], str(item[0])))
+        ]
+
+    return {
+        'count': sum(cube.values()),
+        'product_type': facet('product_type'),
+        'category': facet('category'),
+        'location': facet('location'),
+        'price': [
+            {'value': label, 'min': lower, 'max': upper, 'count': prices[index]}
+            for index, (label, lower, upper) in enumerate(PRICE_BUCKETS)
+        ],
+    }
+
+
+def cube_filters(query_params):
+    """
+    The facet filters of a request, or None when it filters on anything the
+    cached cube cannot answer (search, user, exchange, ...).
+    """
+    filters = {}
+    for key, values in query_params.lists():
+        if key in NON_FILTER_PARAMS:
+            continue
+        if not values or values[-1] == '':
+            continue
+        if key not in FACET_FIELDS:
+            return None
+        # like django-filter, the last value of a repeated param wins
+        filters[key] = {values[-1]}
+    return filters
@@ -0,0 +1,153 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from api.utils.caching import get_versions
+
+
+# the listing embeds product details, so product changes rebuild it too
+SNAPSHOT_VERSION_NAMES = ['flashsale', 'product']
+
+
+class SaleUnavailable(Exception):
+    """The sale is not running or has not got enough stock left."""
+
+
+class AlreadyReserved(Exception):
+    """The user already holds a reservation for the sale."""
+
+
+def get_reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'FLASH_SALE_RESERVATION_TTL', 60 * 10))
+
+
+def take_stock(sale_id, quantity, now):
+    from api.models import FlashSale
+
+    # the database re-checks the condition on the locked row, so concurrent
+    # buyers can never take more than there is
+    return FlashSale.objects.filter(
+        pk=sale_id, stock__gte=quantity, starts_at__lte=now, ends_at__gt=now,
+    ).update(stock=F('stock') - quantity)
+
+
+def reserve(sale_id, user_id, quantity=1):
+    """
+    Holds `quantity` units of a running sale for the user until the
+    reservation TTL runs out. The stock is taken with one conditional
+    UPDATE, no row is read and written back. When the sale looks sold out,
+    or the user's previous reservation has run out, expired reservations
+    are released and it is tried once more.
+    """
+    from api.models import StockReservation
+
+    retried = False
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                if take_stock(sale_id, quantity, now):
+                    return StockReservation.objects.create(
+                        sale_id=sale_id, user_id=user_id, quantity=quantity,
+                        created_at=now, expires_at=now + get_reservation_ttl())
+        except IntegrityError:
+            if retried or not release_expired(sale_id=sale_id, user_id=user_id):
+                raise AlreadyReserved()
+        else:
+            if retried or not release_expired(sale_id=sale_id):
+                raise SaleUnavailable()
+        retried = True
+
+
+def confirm(reservation_id, user_id):
+    from api.models import StockReservation
+
+    now = timezone.now()
+    return bool(StockReservation.objects.filter(
+        pk=reservation_id, user_id=user_id, status='held', expires_at__gt=now,
+    ).update(status='confirmed', confirmed_at=now))
+
+
+def release(reservation_ids, now=None):
+    """
+    Releases the held reservations among `reservation_ids` and gives their
+    stock back. Rows a concurrent confirm or release got to first are left
+    alone, only the rows stamped by this release return stock.
+    """
+    from api.models import FlashSale, StockReservation
+
+    now = now or timezone.now()
+    with transaction.atomic():
+        released = StockReservation.objects.filter(pk__in=reservation_ids, status='held').update(
+            status='released', released_at=now)
+        if released:
+            returned = StockReservation.objects.filter(
+                pk__in=reservation_ids, status='released', released_at=now,
+            ).values('sale_id').annotate(total=Sum('quantity')).values_list('sale_id', 'total')
+            for sale_id, total in returned:
+                FlashSale.objects.filter(pk=sale_id).update(stock=F('stock') + total)
+    return released
+
+
+def release_expired(sale_id=None, user_id=None, batch_size=1000):
+    """
+    Releases expired reservations a batch per transaction, returns how many
+    were released.
+    """
+    from api.models import StockReservation
+
+    now = timezone.now()
+    expired = StockReservation.objects.filter(status='held', expires_at__lte=now)
+    if sale_id is not None:
+        expired = expired.filter(sale_id=sale_id)
+    if user_id is not None:
+        expired = expired.filter(user_id=user_id)
+
+    total = 0
+    while True:
+        ids = list(expired.values_list('pk', flat=True)[:batch_size])
+        if ids:
+            total += release(ids, now)
+        if len(ids) < batch_size:
+            return total
+
+
+def _snapshot_key():
+    versions = get_versions(SNAPSHOT_VERSION_NAMES)
+    return 'flash-sales:snapshot:' + ':'.join(str(versions[name]) for name in SNAPSHOT_VERSION_NAMES)
+
+
+def build_snapshot():
+    from api.models import FlashSale
+    from api.serializers import FlashSaleSerializer
+
+    sales = list(FlashSale.objects.filter(
+        ends_at__gt=timezone.now(), product__is_active=True,
+    ).select_related('product').order_by('starts_at', 'pk'))
+    return [
+        (sale.starts_at, sale.ends_at, data)
+        for sale, data in zip(sales, FlashSaleSerializer(sales, many=True, expand=['product']).data)
+    ]
+
+
+def get_sale_listing():
+    """
+    Running and upcoming sales from a snapshot shared through the cache.
+    The snapshot is rebuilt when sales or products change and at least every
+    FLASH_SALE_SNAPSHOT_TTL seconds, which bounds how stale the stock is.
+    """
+    key = _snapshot_key()
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_snapshot()
+        cache.set(key, snapshot, getattr(settings, 'FLASH_SALE_SNAPSHOT_TTL', 2))
+
+    now = timezone.now()
+    return [
+        {**data, 'is_live': starts_at <= now}
+        for starts_at, ends_at, data in snapshot if ends_at > now
+    ]
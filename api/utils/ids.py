@@ -0,0 +1,116 @@
+import threading
+from collections import deque
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, models, transaction
+from django.utils.crypto import get_random_string
+
+
+ID_ALLOWED_CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+ID_LENGTH = 6
+# how many times an insert is retried with a fresh id after a primary key conflict
+ID_INSERT_ATTEMPTS = 5
+
+
+class IdAllocator:
+    """
+    Hands out random 6 character ids from an in-process pool. The pool is
+    refilled a block at a time, the whole block is checked against the table
+    with one `id IN (...)` query instead of one probe per insert. Ids taken by
+    another process in the meantime surface as a primary key conflict at
+    insert time and are retried with a new id.
+
+    Models whose rows can move to another table and back list its label in
+    `id_shared_with`, candidates are checked against those tables as well.
+    """
+
+    def __init__(self, model, block_size=None):
+        self.model = model
+        self.block_size = block_size
+        self.shared_with = [apps.get_model(label) for label in getattr(model, 'id_shared_with', ())]
+        self.pool = deque()
+        self.lock = threading.Lock()
+
+    def get_block_size(self):
+        if self.block_size is not None:
+            return self.block_size
+        return getattr(settings, 'ID_ALLOCATOR_BLOCK_SIZE', 100)
+
+    def get_taken_ids(self, candidates, using):
+        taken = set()
+        for model in [self.model, *self.shared_with]:
+            taken.update(model._base_manager.using(using).filter(pk__in=candidates).values_list('pk', flat=True))
+        return taken
+
+    def reserve_block(self, size, using=DEFAULT_DB_ALIAS):
+        candidates = {
+            get_random_string(length=ID_LENGTH, allowed_chars=ID_ALLOWED_CHARS) for _ in range(size)
+        }
+        taken = self.get_taken_ids(candidates, using)
+        return [candidate for candidate in candidates if candidate not in taken]
+
+    def allocate(self, count=1, using=DEFAULT_DB_ALIAS):
+        with self.lock:
+            while len(self.pool) < count:
+                self.pool.extend(self.reserve_block(
+                    max(self.get_block_size(), count - len(self.pool)), using))
+            return [self.pool.popleft() for _ in range(count)]
+
+    def clear(self):
+        with self.lock:
+            self.pool.clear()
+
+
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+
+def get_id_allocator(model):
+    label = model._meta.label
+    with _allocators_lock:
+        if label not in _allocators:
+            _allocators[label] = IdAllocator(model)
+        return _allocators[label]
+
+
+def run_with_conflict_retry(using, insert, on_conflict):
+    """
+    Runs `insert`, on an IntegrityError `on_conflict` is called and returns
+    True when new ids were assigned and the insert should be retried. Inside
+    an outer transaction each attempt runs in a savepoint so a conflict does
+    not break the transaction.
+    """
+    for attempt in range(ID_INSERT_ATTEMPTS):
+        try:
+            if connections[using].in_atomic_block:
+                with transaction.atomic(using=using):
+                    return insert()
+            return insert()
+        except IntegrityError:
+            if attempt == ID_INSERT_ATTEMPTS - 1 or not on_conflict():
+                raise
+
+
+class AllocatedIdQuerySet(models.QuerySet):
+    """
+    `bulk_create` that fills in missing ids from the model's IdAllocator.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        allocator = get_id_allocator(self.model)
+        using = self.db
+        missing = [obj for obj in objs if not obj.pk]
+        for obj, allocated_id in zip(missing, allocator.allocate(len(missing), using=using)):
+            obj.pk = allocated_id
+
+        def on_conflict():
+            taken = allocator.get_taken_ids([obj.pk for obj in missing], using)
+            conflicting = [obj for obj in missing if obj.pk in taken]
+            for obj, allocated_id in zip(conflicting, allocator.allocate(len(conflicting), using=using)):
+                obj.pk = allocated_id
+            return bool(conflicting)
+
+        return run_with_conflict_retry(
+            using, lambda: super(AllocatedIdQuerySet, self).bulk_create(objs, *args, **kwargs), on_conflict)
@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from api.utils.caching import bump_version
+
+
+logger = logging.getLogger(__name__)
+
+# name: bounding box, the aspect ratio is kept
+RENDITIONS = {
+    'thumb': (160, 160),
+    'card': (480, 480),
+    'full': (1600, 1600),
+}
+
+RENDITION_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_rendition_storage():
+    storage_path = getattr(settings, 'IMAGE_RENDITION_STORAGE', None)
+    if storage_path:
+        return import_string(storage_path)()
+    return default_storage
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_PIPELINE_WORKERS', 2),
+                thread_name_prefix='image-pipeline')
+        return _executor
+
+
+def rendition_path(instance, source_name, name, extension):
+    # the source name is part of the path so a new upload never hits a stale CDN copy
+    digest = hashlib.sha1(source_name.encode('utf-8')).hexdigest()[:10]
+    return f'images/renditions/{instance._meta.model_name}/{instance.pk}/{name}-{digest}.{extension}'
+
+
+def encode(image, image_format, options):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    output = BytesIO()
+    # no exif is passed on, so camera metadata (GPS etc.) is stripped
+    image.save(output, image_format, **options)
+    return output.getvalue()
+
+
+def generate_renditions(instance, field_name='image'):
+    """
+    Auto-orients the image, then writes every rendition in every format to
+    the rendition storage. Returns {rendition: {format: storage name}}.
+    """
+    # Pillow is only needed here, importing it lazily keeps it out of the cold start
+    from PIL import Image, ImageOps
+
+    field_file = getattr(instance, field_name)
+    storage = get_rendition_storage()
+
+    with field_file.open('rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        image.load()
+
+    renditions = {}
+    for name, size in RENDITIONS.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        renditions[name] = {}
+        for extension, (image_format, options) in RENDITION_FORMATS.items():
+            path = rendition_path(instance, field_file.name, name, extension)
+            if storage.exists(path):
+                storage.delete(path)
+            renditions[name][extension] = storage.save(path, ContentFile(encode(resized, image_format, options)))
+    return renditions
+
+
+def process_image(model_label, pk):
+    model = apps.get_model(model_label)
+    try:
+        instance = model._base_manager.filter(pk=pk).first()
+        if instance is None:
+            return
+        renditions = generate_renditions(instance) if instance.image else {}
+        # only store the result if the image was not replaced in the meantime
+        unchanged = model._base_manager.filter(pk=pk)
+        if instance.image:
+            unchanged = unchanged.filter(image=instance.image.name)
+        else:
+            unchanged = unchanged.filter(Q(image='') | Q(image__isnull=True))
+        unchanged.update(image_renditions=renditions, updated_at=timezone.now())
+        bump_version(model._meta.model_name)
+    except Exception:
+        logger.exception('Could not generate image renditions for %s %s', model_label, pk)
+    finally:
+        if getattr(settings, 'IMAGE_PIPELINE_SYNC', False) is False:
+            connection.close()
+
+
+def schedule_renditions(instance):
+    """
+    Generates the renditions off the request path once the transaction
+    commits, or inline when IMAGE_PIPELINE_SYNC is set (tests, scripts).
+
+    The executor lives in the web process, so a queued image is lost when
+    the process exits or, on a serverless host, is frozen after the
+    response. `manage.py generate_image_renditions --missing-only` is the
+    backfill job for those and has to run on a schedule there.
+    """
+    model_label, pk = instance._meta.label, instance.pk
+    if getattr(settings, 'IMAGE_PIPELINE_SYNC', False):
+        process_image(model_label, pk)
+        return
+    transaction.on_commit(lambda: get_executor().submit(process_image, model_label, pk))
+
+
+def rendition_urls(renditions):
+    storage = get_rendition_storage()
+    return {
+        name: {extension: storage.url(path) for extension, path in formats.items()}
+        for name, formats in (renditions or {}).items()
+    }
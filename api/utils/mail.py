@@ -0,0 +1,153 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+
+# what is kept of a body once the email is out, the codes in it must not outlive the send
+REDACTED_BODY = '[redacted]'
+
+
+def queue_email(subject, body, to, from_email=None, html_body=None):
+    """
+    Stores an email in the outbox, it is sent later by the
+    `send_queued_email` worker so requests never wait on SMTP.
+    """
+    from api.models import OutboundEmail
+
+    if isinstance(to, str):
+        to = [to]
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=','.join(to),
+    )
+
+
+def get_retry_delay(attempts):
+    base = getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 30)
+    maximum = getattr(settings, 'EMAIL_OUTBOX_MAX_RETRY_DELAY', 60 * 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), maximum))
+
+
+def build_message(email, connection):
+    msg = EmailMultiAlternatives(
+        email.subject,
+        email.body,
+        email.from_email,
+        email.to.split(','),
+        connection=connection,
+    )
+    if email.html_body:
+        msg.attach_alternative(email.html_body, 'text/html')
+    return msg
+
+
+def claim_emails(batch_size):
+    """
+    Marks a batch of due emails as `sending` and commits, so no lock is held
+    while they are sent. A claim runs out after EMAIL_OUTBOX_CLAIM_TIMEOUT,
+    the rows of a worker that died mid-batch are then claimed again.
+    """
+    from api.models import OutboundEmail
+
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status__in=['pending', 'sending'], next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        for email in emails:
+            email.status = 'sending'
+            email.next_attempt_at = now + timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_CLAIM_TIMEOUT', 60 * 10))
+            email.updated_at = now
+        OutboundEmail.objects.bulk_update(emails, ['status', 'next_attempt_at', 'updated_at'])
+    return emails
+
+
+def send_queued_emails(batch_size=None, connection=None):
+    """
+    Sends one batch of due emails over a single SMTP connection and returns
+    (sent, retried, failed) counts. Rows are claimed with SKIP LOCKED where
+    the database supports it so several workers can share the outbox. The
+    bodies of sent and failed emails are blanked, they hold one time codes.
+    """
+    from api.models import OutboundEmail
+
+    batch_size = batch_size or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 50)
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    counts = {'sent': 0, 'retried': 0, 'failed': 0}
+
+    def record_failure(email, error):
+        email.attempts += 1
+        email.last_error = repr(error)
+        email.updated_at = timezone.now()
+        if email.attempts >= max_attempts:
+            email.status = 'failed'
+            email.body = REDACTED_BODY
+            email.html_body = None
+            counts['failed'] += 1
+        else:
+            email.status = 'pending'
+            email.next_attempt_at = timezone.now() + get_retry_delay(email.attempts)
+            counts['retried'] += 1
+
+    emails = claim_emails(batch_size)
+    if not emails:
+        return counts['sent'], counts['retried'], counts['failed']
+
+    connection = connection or get_connection()
+    pending = list(emails)
+    try:
+        connection.open()
+        while pending:
+            email = pending.pop(0)
+            try:
+                build_message(email, connection).send()
+            except Exception as e:
+                record_failure(email, e)
+                # the connection may be broken, go on with a fresh one
+                connection.close()
+                connection.open()
+            else:
+                email.attempts += 1
+                email.status = 'sent'
+                email.sent_at = email.updated_at = timezone.now()
+                email.last_error = None
+                email.body = REDACTED_BODY
+                email.html_body = None
+                counts['sent'] += 1
+    except Exception as e:
+        # could not (re)connect, the rest of the batch is retried later
+        for email in pending:
+            record_failure(email, e)
+    finally:
+        connection.close()
+
+    OutboundEmail.objects.bulk_update(
+        emails, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at', 'updated_at', 'body', 'html_body'])
+
+    return counts['sent'], counts['retried'], counts['failed']
+
+
+def purge_outbound_emails(batch_size=1000):
+    """
+    Deletes sent and failed emails older than EMAIL_OUTBOX_RETENTION_DAYS a
+    batch at a time, returns how many were deleted.
+    """
+    from api.models import OutboundEmail
+
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'EMAIL_OUTBOX_RETENTION_DAYS', 7))
+    finished = OutboundEmail.objects.filter(status__in=['sent', 'failed'], updated_at__lt=cutoff)
+    total = 0
+    while True:
+        ids = list(finished.values_list('pk', flat=True)[:batch_size])
+        if ids:
+            total += OutboundEmail.objects.filter(pk__in=ids).delete()[0]
+        if len(ids) < batch_size:
+            return total
@@ -0,0 +1,272 @@
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from api.utils import barter
+from api.utils.caching import cache_is_shared
+
+
+logger = logging.getLogger(__name__)
+
+# long enough to outlive any long-poll, older notifications are found by the first query
+LATEST_TIMEOUT = 60 * 60
+MAX_POLL_RESULTS = 100
+
+# wakes the long-polls of this process right away, other processes see the cache marker
+_arrived = threading.Condition()
+
+
+def _latest_key(user_id):
+    return f'notifications:latest:{user_id}'
+
+
+def get_latest_id(user_id):
+    return cache.get(_latest_key(user_id))
+
+
+def mark_latest(latest):
+    cache.set_many({_latest_key(user_id): pk for user_id, pk in latest.items()}, LATEST_TIMEOUT)
+    with _arrived:
+        _arrived.notify_all()
+
+
+def _write_batch(notifications):
+    from api.models import Notification, User
+
+    with transaction.atomic():
+        Notification.objects.bulk_create(notifications)
+        # one UPDATE per distinct count, in practice one per batch
+        by_count = defaultdict(list)
+        for user_id, count in Counter(n.user_id for n in notifications).items():
+            by_count[count].append(user_id)
+        for count, user_ids in by_count.items():
+            User.objects.filter(pk__in=user_ids).update(
+                unread_notifications=F('unread_notifications') + count)
+
+        latest = {}
+        for notification in notifications:
+            latest[notification.user_id] = max(notification.pk, latest.get(notification.user_id, 0))
+        transaction.on_commit(lambda: mark_latest(latest))
+
+
+def send_notifications(notifications, batch_size=None):
+    """
+    Saves unsaved Notification instances with `bulk_create`, one transaction
+    per batch, and raises the recipients' unread counters in the same
+    transaction. Waiting long-polls are woken once the batch commits.
+    """
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_BATCH_SIZE', 500)
+    sent = 0
+    batch = []
+    for notification in notifications:
+        batch.append(notification)
+        if len(batch) >= batch_size:
+            _write_batch(batch)
+            sent += len(batch)
+            batch = []
+    if batch:
+        _write_batch(batch)
+        sent += len(batch)
+    return sent
+
+
+def notify_users(user_ids, kind, title, body='', data=None, batch_size=None):
+    """
+    Fans the same notification out to every user in `user_ids`.
+    """
+    from api.models import Notification
+
+    return send_notifications(
+        (
+            Notification(user_id=user_id, kind=kind, title=title, body=body, data=data or {})
+            for user_id in dict.fromkeys(user_ids)
+        ),
+        batch_size=batch_size,
+    )
+
+
+def mark_read(user_id, ids=None):
+    """
+    Marks the user's unread notifications, or only `ids`, as read and lowers
+    the counter by the number of rows that actually changed.
+    """
+    from api.models import Notification, User
+
+    with transaction.atomic():
+        unread = Notification.objects.filter(user_id=user_id, read_at__isnull=True)
+        if ids is not None:
+            unread = unread.filter(pk__in=ids)
+        marked = unread.update(read_at=timezone.now())
+        if marked:
+            User.objects.filter(pk=user_id).update(
+                unread_notifications=Greatest(F('unread_notifications') - marked, 0))
+    return marked
+
+
+def get_unread_count(user_id):
+    from api.models import User
+
+    return User.objects.filter(pk=user_id).values_list('unread_notifications', flat=True).first() or 0
+
+
+def get_long_poll_timeout(request):
+    """
+    The longest a poll may wait. Waiting needs a shared cache to learn about
+    notifications sent by other processes, without one polls answer right
+    away. A sync WSGI worker is held for the whole wait, so long waits are
+    only allowed on the ASGI app.
+    """
+    if not cache_is_shared():
+        return 0
+    if isinstance(request, ASGIRequest):
+        return getattr(settings, 'NOTIFICATION_LONG_POLL_TIMEOUT', 25)
+    return getattr(settings, 'NOTIFICATION_LONG_POLL_WSGI_TIMEOUT', 5)
+
+
+def get_poll_retry_after():
+    return getattr(settings, 'NOTIFICATION_POLL_RETRY_AFTER', 10)
+
+
+def wait_for_notifications(user_id, after, timeout, interval=None):
+    """
+    Blocks until a notification newer than `after` was sent to the user or
+    `timeout` seconds passed, returns whether one arrived. Only the cache is
+    read while waiting, the database connection is given back meanwhile.
+    """
+    interval = interval or getattr(settings, 'NOTIFICATION_POLL_INTERVAL', 1)
+    if not connection.in_atomic_block:
+        connection.close()
+
+    deadline = time.monotonic() + timeout
+    while True:
+        latest = get_latest_id(user_id)
+        if latest is not None and latest > after:
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        with _arrived:
+            _arrived.wait(min(interval, remaining))
+
+
+def notify_new_matches(product, limit=20):
+    """
+    Tells the owners of the best two-way matches that a new listing matches
+    theirs.
+    """
+    from api.models import Notification
+
+    matches = barter.find_matches(product, limit=limit)['two_way']
+    send_notifications(
+        Notification(
+            user_id=match['product'].user_id,
+            kind='match',
+            title='New barter match',
+            body=f"{product.name} is a match for your {match['product'].name}",
+            data={'product': match['product'].pk, 'match': product.pk},
+        )
+        for match in matches
+    )
+
+
+def notify_price_drop(product):
+    """
+    Tells the owners of products that want what `product` has that it got
+    cheaper, one notification per owner.
+    """
+    from api.models import Product
+
+    if not product.is_active:
+        return
+    seekers = barter.find_seekers(product, barter.have_tokens(product))
+    owners = Product.objects.filter(pk__in=list(seekers), is_active=True).values_list('user_id', flat=True)
+    notify_users(
+        owners,
+        kind='price_drop',
+        title='Price drop',
+        body=f'{product.name} is now {product.price}',
+        data={'product': product.pk, 'price': str(product.price)},
+    )
+
+
+def queue_product_notifications(product, kind, old_price=None):
+    """
+    Queues the fan-out for a new or cheaper product. It is written with the
+    product, in the same transaction.
+    """
+    from api.models import NotificationJob
+
+    if kind == 'price_drop' and NotificationJob.objects.filter(
+            product_id=product.pk, kind=kind, claimed_until__isnull=True).exists():
+        # the queued job already compares against the earlier, higher price
+        return None
+    return NotificationJob.objects.create(product_id=product.pk, kind=kind, old_price=old_price)
+
+
+def claim_notification_jobs(batch_size):
+    """
+    Claims a batch of queued jobs for NOTIFICATION_JOB_CLAIM_TIMEOUT and
+    commits, the jobs of a worker that died are claimed again after that.
+    """
+    from api.models import NotificationJob
+
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            NotificationJob.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(Q(claimed_until__isnull=True) | Q(claimed_until__lte=now))
+            .select_related('product').order_by('pk')[:batch_size]
+        )
+        NotificationJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            claimed_until=now + timedelta(seconds=getattr(settings, 'NOTIFICATION_JOB_CLAIM_TIMEOUT', 60 * 5)),
+            attempts=F('attempts') + 1,
+        )
+    return jobs
+
+
+def run_notification_job(job):
+    product = job.product
+    if not product.is_active:
+        return
+    if job.kind == 'new_product':
+        notify_new_matches(product)
+    elif job.old_price is None or product.price < job.old_price:
+        notify_price_drop(product)
+
+
+def run_notification_jobs(batch_size=None):
+    """
+    Runs one batch of queued jobs, returns (done, failed) counts. A failed
+    job is retried once its claim runs out, up to NOTIFICATION_JOB_MAX_ATTEMPTS
+    times.
+    """
+    from api.models import NotificationJob
+
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_JOB_BATCH_SIZE', 100)
+    max_attempts = getattr(settings, 'NOTIFICATION_JOB_MAX_ATTEMPTS', 3)
+    finished = []
+    done = failed = 0
+    for job in claim_notification_jobs(batch_size):
+        try:
+            run_notification_job(job)
+        except Exception:
+            logger.exception('Notification job %s for product %s failed', job.kind, job.product_id)
+            failed += 1
+            # claimed again once the claim runs out, dropped after the last attempt
+            if job.attempts + 1 < max_attempts:
+                continue
+        else:
+            done += 1
+        finished.append(job.pk)
+    NotificationJob.objects.filter(pk__in=finished).delete()
+    return done, failed
@@ -0,0 +1,10 @@
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    """
+    Documents the bearer auth of the cached JWT authentication like
+    simplejwt's own. Imported by the schema generation only, so the API
+    workers never load drf-spectacular's extension machinery.
+    """
+    target_class = 'api.utils.perms_and_auth.CachedJWTAuthentication'
@@ -0,0 +1,248 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class KeysetPaginationMixin:
+    """
+    Keyset (cursor) pagination over whatever ordering the filter backends
+    applied, with the primary key appended as a unique tiebreaker. Pages are
+    fetched with a `WHERE (ordering) > (last row)` condition so the cost does
+    not grow with depth.
+    """
+    cursor_query_param = 'cursor'
+    cursor_query_description = 'The pagination cursor value.'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_keyset(self, queryset, request, view=None):
+        self.keyset = True
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.ordering = self.get_keyset_ordering(queryset, view)
+        self.count = self.get_count(queryset) if self.include_count(request, False) else None
+
+        values, reverse = self.decode_cursor(request)
+        order_by = [
+            ('-' if descending != reverse else '') + field
+            for field, descending in self.ordering
+        ]
+        try:
+            if values is not None:
+                queryset = queryset.filter(self.keyset_filter(values, reverse))
+            rows = list(queryset.order_by(*order_by)[:self.limit + 1])
+        except (ValidationError, TypeError, ValueError):
+            if values is None:
+                raise
+            # position values the ordered fields do not accept
+            raise NotFound(self.invalid_cursor_message)
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if reverse:
+            rows.reverse()
+
+        if reverse:
+            self.has_next = values is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = values is not None
+
+        self.first_position = self.get_position(rows[0]) if rows else values
+        self.last_position = self.get_position(rows[-1]) if rows else values
+        return rows
+
+    def get_keyset_ordering(self, queryset, view):
+        ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+        if not ordering:
+            ordering = getattr(view, 'ordering', None) or settings.REST_FRAMEWORK.get(
+                'DEFAULT_ORDERING', ())
+            if isinstance(ordering, str):
+                ordering = (ordering,)
+
+        parsed = []
+        for field in ordering:
+            descending = field.startswith('-')
+            field = field.lstrip('-')
+            if field == queryset.model._meta.pk.name:
+                field = 'pk'
+            parsed.append((field, descending))
+            if field == 'pk':
+                return parsed
+
+        tiebreak_descending = parsed[-1][1] if parsed else False
+        parsed.append(('pk', tiebreak_descending))
+        return parsed
+
+    def keyset_filter(self, values, reverse):
+        condition = Q()
+        equal = Q()
+        for (field, descending), value in zip(self.ordering, values):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def get_position(self, row):
+        return [_encode_value(getattr(row, field)) for field, _ in self.ordering]
+
+    def get_ordering_signature(self):
+        return [('-' if descending else '') + field for field, descending in self.ordering]
+
+    def encode_cursor(self, values, reverse):
+        # the ordering is kept so a cursor is not applied to another ordering
+        payload = json.dumps(
+            {'o': self.get_ordering_signature(), 'p': values, 'r': int(reverse)}, separators=(',', ':'))
+        cursor = urlsafe_b64encode(payload.encode('ascii')).decode('ascii').rstrip('=')
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.offset_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            encoded += '=' * (-len(encoded) % 4)
+            payload = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))
+            ordering = payload['o']
+            values = payload['p']
+            reverse = bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if (ordering != self.get_ordering_signature() or not isinstance(values, list)
+                or len(values) != len(self.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def get_keyset_next_link(self):
+        if not self.has_next or self.last_position is None:
+            return None
+        return self.encode_cursor(self.last_position, False)
+
+    def get_keyset_previous_link(self):
+        if not self.has_previous or self.first_position is None:
+            return None
+        return self.encode_cursor(self.first_position, True)
+
+
+class HybridPagination(KeysetPaginationMixin, LimitOffsetPagination):
+    """
+    Limit/offset pagination kept for existing clients, switching to keyset
+    pagination when a `cursor` is sent or `pagination=cursor` is requested.
+    `count=false` skips the `COUNT(*)` query in both modes, keyset pages only
+    include the count when asked with `count=true`.
+    """
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    keyset = False
+
+    def use_keyset(self, request):
+        return (self.cursor_query_param in request.query_params
+                or request.query_params.get(self.mode_query_param) == 'cursor')
+
+    def include_count(self, request, default=True):
+        value = request.query_params.get(self.count_query_param)
+        if value is None:
+            return default
+        return value.lower() not in ('0', 'false', 'no')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request):
+            return self.paginate_keyset(queryset, request, view)
+        if self.include_count(request):
+            return super().paginate_queryset(queryset, request, view)
+
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.count = None
+        self.offset = self.get_offset(request)
+        self.request = request
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        return rows[:self.limit]
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+    def get_next_link(self):
+        if self.keyset:
+            return self.get_keyset_next_link()
+        if self.count is None:
+            if not self.has_next:
+                return None
+            url = self.request.build_absolute_uri()
+            url = replace_query_param(url, self.limit_query_param, self.limit)
+            return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.keyset:
+            return self.get_keyset_previous_link()
+        return super().get_previous_link()
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count']['nullable'] = True
+        return response_schema
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': self.cursor_query_description,
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Set to `cursor` to start keyset pagination.',
+                'schema': {'type': 'string', 'enum': ['offset', 'cursor']},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Include the total count in the response.',
+                'schema': {'type': 'boolean'},
+            },
+        ]
+
+
+class KeysetPagination(HybridPagination):
+    """
+    Always keyset pages, for lists that are only ever scrolled.
+    """
+
+    def use_keyset(self, request):
+        return True
@@ -1,4 +1,113 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import LazyObject, empty
+from django.utils.translation import gettext_lazy as _
 from rest_framework.permissions import BasePermission
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from api.utils.caching import cache_is_shared
+from api.utils.db_routing import primary_reads
+from api.utils.revocation import is_token_revoked
+
+# the only user fields the auth and permission classes read on every request
+USER_STATUS_FIELDS = (
+    'is_active', 'is_suspended', 'email_confirmed', 'is_staff', 'is_superuser', 'tokens_valid_after',
+)
+
+
+def user_status_cache_key(user_id):
+    return f'auth:user-status:{user_id}'
+
+
+def get_user_status_timeout():
+    # a per-process cache only drops the saving worker's copy, the others go
+    # on trusting theirs until it expires
+    if cache_is_shared():
+        return getattr(settings, 'USER_STATUS_CACHE_TIMEOUT', 60 * 60)
+    return getattr(settings, 'USER_STATUS_LOCAL_CACHE_TIMEOUT', 5)
+
+
+def get_user_status(user_id):
+    key = user_status_cache_key(user_id)
+    status = cache.get(key)
+    if status is None:
+        with primary_reads():
+            status = get_user_model().objects.filter(pk=user_id).values(*USER_STATUS_FIELDS).first()
+        if status is None:
+            return None
+        cache.set(key, status, get_user_status_timeout())
+    return status
+
+
+def invalidate_user_status(user_id):
+    cache.delete(user_status_cache_key(user_id))
+
+
+class LazyUser(LazyObject):
+    """
+    Stands in for the authenticated user, the id and status flags come from
+    the cache and the `User` row is only loaded when a view reads anything
+    else. Once loaded, every attribute comes from the row.
+    """
+
+    def __init__(self, user_id, status):
+        super().__init__()
+        # set through __dict__, LazyObject.__setattr__ would load the row. The id
+        # sits there like on a model instance so it is readable without loading
+        self.__dict__['id'] = user_id
+        self.__dict__['_status'] = dict(status)
+
+    def __getattr__(self, name):
+        if self._wrapped is empty:
+            if name == 'pk':
+                return self.__dict__['id']
+            if name in self._status:
+                return self._status[name]
+        return super().__getattr__(name)
+
+    def _setup(self):
+        self._wrapped = get_user_model().objects.get(pk=self.__dict__['id'])
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
+
+    def __bool__(self):
+        return True
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that checks the user status from the shared cache
+    instead of loading the `User` row on every request. Revoked tokens are
+    rejected, see `api.utils.revocation`.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        status = get_user_status(user_id)
+        if status is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        if not status['is_active']:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if is_token_revoked(validated_token, status):
+            raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
+
+        return LazyUser(user_id, status)
+
 
 class MyBasePerm(BasePermission):
     def check_basic_perm(self, request, view):
@@ -0,0 +1,130 @@
+import csv
+import io
+import json
+
+from django.db import transaction
+from rest_framework import serializers as drf_serializers
+
+from api import models
+from api.serializers import ProductImportSerializer
+from api.utils import barter, facets, search
+from api.utils.caching import bump_version
+
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+
+class ImportResult:
+    def __init__(self, max_errors=1000, error_sink=None):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+        self.error_sink = error_sink
+
+    def add_error(self, row, errors):
+        self.failed += 1
+        error = {'row': row, 'errors': errors}
+        if self.error_sink is not None:
+            self.error_sink(error)
+        # only the first errors are kept so memory stays flat on bad files
+        elif len(self.errors) < self.max_errors:
+            self.errors.append(error)
+
+    def as_dict(self):
+        return {'created': self.created, 'failed': self.failed, 'errors': self.errors}
+
+
+def guess_format(filename, default='csv'):
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def iter_rows(stream, file_format):
+    """
+    Yields (row number, row dict or None, error) from a text stream without
+    reading the whole file.
+    """
+    if file_format == 'csv':
+        for row_number, row in enumerate(csv.DictReader(stream), 1):
+            # empty cells mean "not given" so model defaults apply
+            yield row_number, {key: value for key, value in row.items() if key and value != ''}, None
+        return
+
+    for row_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, {'non_field_errors': [f'Invalid JSON: {e}']}
+            continue
+        if not isinstance(row, dict):
+            yield row_number, None, {'non_field_errors': ['Expected a JSON object']}
+            continue
+        yield row_number, row, None
+
+
+def text_stream(binary_file):
+    return io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+
+
+def build_lookup(queryset, name_field):
+    """
+    Maps both the id and the lowercased name to the instance, loaded once so
+    rows resolve categories and locations without a query each.
+    """
+    lookup = {}
+    for instance in queryset:
+        lookup[str(instance.pk)] = instance
+        lookup[getattr(instance, name_field).strip().lower()] = instance
+    return lookup
+
+
+def write_batch(products):
+    with transaction.atomic():
+        models.Product.objects.bulk_create(products)
+        search.index_products(products)
+        barter.index_products(products)
+        facets.adjust_many(facets.product_cell(vars(product)) for product in products)
+    bump_version('product')
+
+
+def import_products(rows, user_id, batch_size=500, max_errors=1000, error_sink=None):
+    """
+    Validates rows with the product serializer rules and writes the valid
+    ones with `bulk_create`, one transaction per batch. Row errors go to
+    `error_sink` when given, otherwise the first `max_errors` are collected.
+    """
+    result = ImportResult(max_errors=max_errors, error_sink=error_sink)
+    serializer = ProductImportSerializer(context={
+        'categories': build_lookup(models.Category.objects.all(), 'name'),
+        'locations': build_lookup(models.Location.objects.all(), 'state'),
+    })
+
+    batch = []
+    for row_number, row, error in rows:
+        if error:
+            result.add_error(row_number, error)
+            continue
+        try:
+            data = serializer.run_validation(row)
+        except drf_serializers.ValidationError as e:
+            result.add_error(row_number, e.detail)
+            continue
+
+        batch.append(models.Product(user_id=user_id, **data))
+        if len(batch) >= batch_size:
+            write_batch(batch)
+            result.created += len(batch)
+            batch = []
+
+    if batch:
+        write_batch(batch)
+        result.created += len(batch)
+    return result
@@ -0,0 +1,172 @@
+import hashlib
+import math
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from api.utils.caching import bump_version, get_version
+from api.utils.db_routing import primary_reads
+
+
+VERSION_NAME = 'revoked_token'
+# rows committed out of order are caught by re-reading this far back on every sync
+SYNC_OVERLAP = timedelta(minutes=5)
+
+
+class BloomFilter:
+    """
+    Fixed size bloom filter over strings, sized for `capacity` entries at
+    the given false positive rate.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(capacity, 1)
+        self.size = max(int(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self.size for index in range(self.hash_count)]
+
+    def add(self, value):
+        added = False
+        for position in self._positions(value):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                self.bits[position >> 3] |= 1 << (position & 7)
+                added = True
+        # values already in, such as the overlap re-read on every sync, are not counted again
+        if added:
+            self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class RevocationFilter:
+    """
+    Process local bloom filter of revoked token ids. It is brought up to
+    date incrementally when the shared `revoked_token` version changes, and
+    at least every REVOCATION_FILTER_SYNC_INTERVAL seconds for revocations
+    whose version bump never reached this process (a cache that is not
+    shared). Checking a token that was never revoked needs no query; only
+    filter hits are confirmed against the `RevokedToken` table.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.version = None
+        self.synced_at = None
+        self.built_at = None
+
+    def get_capacity(self):
+        return getattr(settings, 'REVOCATION_FILTER_CAPACITY', 10000)
+
+    def get_error_rate(self):
+        return getattr(settings, 'REVOCATION_FILTER_ERROR_RATE', 0.01)
+
+    def get_sync_interval(self):
+        return timedelta(seconds=getattr(settings, 'REVOCATION_FILTER_SYNC_INTERVAL', 5))
+
+    def is_current(self, version):
+        return (version == self.version and self.synced_at is not None
+                and timezone.now() - self.synced_at < self.get_sync_interval())
+
+    def rebuild(self, now):
+        from api.models import RevokedToken
+
+        jtis = list(RevokedToken.objects.filter(expires_at__gt=now).values_list('jti', flat=True))
+        bloom = BloomFilter(max(self.get_capacity(), len(jtis) * 2), self.get_error_rate())
+        for jti in jtis:
+            bloom.add(jti)
+        self.bloom = bloom
+        self.built_at = now
+
+    def sync(self):
+        from api.models import RevokedToken
+
+        version = get_version(VERSION_NAME)
+        if self.is_current(version):
+            return
+        with self.lock, primary_reads():
+            if self.is_current(version):
+                return
+            now = timezone.now()
+            # expired ids are only dropped by a rebuild, bloom filters cannot delete
+            stale = self.built_at is None or now - self.built_at > api_settings.ACCESS_TOKEN_LIFETIME
+            if self.bloom is None or stale or self.bloom.count > self.bloom.capacity:
+                self.rebuild(now)
+            else:
+                for jti in RevokedToken.objects.filter(
+                        revoked_at__gte=self.synced_at - SYNC_OVERLAP).values_list('jti', flat=True):
+                    self.bloom.add(jti)
+            self.synced_at = now
+            self.version = version
+
+    def might_contain(self, jti):
+        self.sync()
+        return jti in self.bloom
+
+    def reset(self):
+        with self.lock:
+            self.bloom = self.version = self.synced_at = self.built_at = None
+
+
+revocation_filter = RevocationFilter()
+
+
+def token_expiry(token):
+    return datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+
+
+def token_issued_at(token):
+    """
+    The token's iat. simplejwt only puts it in access tokens from 5.3.0 on
+    (requirements.txt pins 5.3.1), without it the issue time follows from
+    exp and the token lifetime.
+    """
+    issued_at = token.get('iat')
+    if issued_at is not None:
+        return issued_at
+    lifetime = getattr(token, 'lifetime', None) or api_settings.ACCESS_TOKEN_LIFETIME
+    return token['exp'] - int(lifetime.total_seconds())
+
+
+def revoke_token(token, user_id):
+    from api.models import RevokedToken
+
+    jti = token.get(api_settings.JTI_CLAIM)
+    if not jti:
+        return
+    RevokedToken.objects.get_or_create(jti=jti, defaults={'user_id': user_id, 'expires_at': token_expiry(token)})
+    transaction.on_commit(lambda: bump_version(VERSION_NAME))
+
+
+def revoke_all_tokens(user):
+    """
+    Moves the user's watermark, every token issued before now stops working.
+    """
+    user.tokens_valid_after = timezone.now()
+    user.save(update_fields=['tokens_valid_after'])
+
+
+def is_token_revoked(token, status):
+    from api.models import RevokedToken
+
+    watermark = status.get('tokens_valid_after')
+    # iat has a one second resolution, tokens from the watermark's second are kept
+    if watermark is not None and token_issued_at(token) < int(watermark.timestamp()):
+        return True
+
+    jti = token.get(api_settings.JTI_CLAIM)
+    if not jti or not revocation_filter.might_contain(jti):
+        return False
+    with primary_reads():
+        return RevokedToken.objects.filter(jti=jti).exists()
@@ -0,0 +1,76 @@
+import hashlib
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.http import quote_etag
+
+from api.utils import compression
+
+
+_artifact = None
+_artifact_lock = threading.Lock()
+
+
+def get_schema_version():
+    return settings.SPECTACULAR_SETTINGS.get('VERSION', '0')
+
+
+def get_schema_path(version=None):
+    schema_dir = Path(getattr(settings, 'API_SCHEMA_DIR', settings.BASE_DIR / 'api' / 'schema'))
+    return schema_dir / f'openapi-{version or get_schema_version()}.json'
+
+
+def generate_schema():
+    """
+    Introspects every view and returns the schema as JSON bytes, this is the
+    slow part that `build_schema` moves out of the request path.
+    """
+    from drf_spectacular.renderers import OpenApiJsonRenderer
+    from drf_spectacular.settings import spectacular_settings
+
+    from api.utils import openapi  # noqa: F401
+
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(request=None, public=True)
+    return OpenApiJsonRenderer().render(schema, renderer_context={})
+
+
+class SchemaArtifact:
+    """
+    A built schema held in memory with its ETag, compressed bodies are made
+    once per encoding and kept.
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.etag = quote_etag(hashlib.sha1(content).hexdigest()[:20])
+        self.encoded = {None: content}
+        self.lock = threading.Lock()
+
+    def get_content(self, coding):
+        with self.lock:
+            if coding not in self.encoded:
+                self.encoded[coding] = compression.compress(self.content, coding)
+            return self.encoded[coding]
+
+
+def get_schema_artifact():
+    """
+    Loads the artifact for the current API version once per process, returns
+    None when it has not been built.
+    """
+    global _artifact
+    with _artifact_lock:
+        if _artifact is None:
+            try:
+                _artifact = SchemaArtifact(get_schema_path().read_bytes())
+            except FileNotFoundError:
+                return None
+        return _artifact
+
+
+def clear_schema_artifact():
+    global _artifact
+    with _artifact_lock:
+        _artifact = None
@@ -0,0 +1,206 @@
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from rest_framework import filters
+
+
+TOKEN_MAX_LENGTH = 50
+
+# weight of a token depending on the product field it was found in
+FIELD_WEIGHTS = {
+    'name': 8,
+    'category': 4,
+    'exchange': 3,
+    'location': 2,
+    'description': 1,
+}
+
+STOP_WORDS = {
+    'a', 'an', 'and', 'for', 'in', 'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with',
+    # pidgin fillers
+    'abeg', 'dey', 'na', 'wey', 'una', 'oga', 'sharp',
+}
+
+# Nigerian-English, pidgin and British spellings mapped to one indexed form
+SPELLING_VARIANTS = {
+    'fone': 'phone',
+    'fon': 'phone',
+    'handset': 'phone',
+    'telly': 'television',
+    'tv': 'television',
+    'lappy': 'laptop',
+    'lapi': 'laptop',
+    'gen': 'generator',
+    'genset': 'generator',
+    'igen': 'generator',
+    'okada': 'motorcycle',
+    'keke': 'tricycle',
+    'napep': 'tricycle',
+    'motor': 'car',
+    'moto': 'car',
+    'fridge': 'refrigerator',
+    'pikin': 'child',
+    'pickin': 'child',
+    'naija': 'nigeria',
+    'colour': 'color',
+    'jewellery': 'jewelry',
+    'tyre': 'tire',
+    'centre': 'center',
+    'aircon': 'ac',
+}
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def _stem(word):
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def normalize_word(word):
+    word = SPELLING_VARIANTS.get(word, word)
+    word = _stem(word)
+    return SPELLING_VARIANTS.get(word, word)[:TOKEN_MAX_LENGTH]
+
+
+def split_words(text):
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', str(text))
+    text = text.encode('ascii', 'ignore').decode('ascii').lower()
+    return _WORD_RE.findall(text)
+
+
+def tokenize(text):
+    tokens = []
+    for word in split_words(text):
+        if word in STOP_WORDS:
+            continue
+        token = normalize_word(word)
+        if token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+def product_tokens(product):
+    """
+    Returns a {token: weight} map for the searchable fields of a product.
+    """
+    fields = {
+        'name': product.name,
+        'description': product.description,
+        'exchange': product.exchange,
+        'category': product.category.name,
+        'location': product.location.state,
+    }
+    weights = {}
+    for field, text in fields.items():
+        for token in tokenize(text):
+            weights[token] = weights.get(token, 0) + FIELD_WEIGHTS[field]
+    return weights
+
+
+def build_product_index_rows(product):
+    from api.models import ProductSearchToken
+
+    return [
+        ProductSearchToken(product_id=product.pk, token=token, weight=weight)
+        for token, weight in product_tokens(product).items()
+    ]
+
+
+def index_product(product):
+    from api.models import ProductSearchToken
+
+    with transaction.atomic():
+        ProductSearchToken.objects.filter(product_id=product.pk).delete()
+        ProductSearchToken.objects.bulk_create(build_product_index_rows(product))
+
+
+def index_products(products, batch_size=500):
+    """
+    Reindexes many products, `products` should have category and location
+    selected to avoid a query per row.
+    """
+    from api.models import ProductSearchToken
+
+    batch = []
+    count = 0
+    for product in products:
+        batch.append(product)
+        if len(batch) >= batch_size:
+            count += _index_batch(ProductSearchToken, batch)
+            batch = []
+    if batch:
+        count += _index_batch(ProductSearchToken, batch)
+    return count
+
+
+def _index_batch(model, products):
+    rows = []
+    for product in products:
+        rows.extend(build_product_index_rows(product))
+    with transaction.atomic():
+        model.objects.filter(product_id__in=[p.pk for p in products]).delete()
+        model.objects.bulk_create(rows)
+    return len(products)
+
+
+def parse_query(query):
+    """
+    Returns a list of (token, is_prefix) pairs. The last word is matched as a
+    prefix while the user is still typing it.
+    """
+    query = (query or '').replace('\x00', '').replace(',', ' ')
+    words = [word for word in split_words(query) if word not in STOP_WORDS]
+    typing = bool(words) and not query[-1:].isspace()
+    terms = []
+    for index, word in enumerate(words):
+        is_prefix = typing and index == len(words) - 1
+        term = (word if is_prefix else normalize_word(word), is_prefix)
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+
+def term_filter(token, is_prefix, field='token'):
+    if not is_prefix:
+        return Q(**{field: token})
+    # tokens are [a-z0-9], '{' sorts right after 'z' so this is an indexable range
+    return Q(**{f'{field}__gte': token, f'{field}__lt': token + '{'}) | Q(**{field: normalize_word(token)})
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    Matches products through the inverted index in `ProductSearchToken`
+    instead of an `icontains` scan, every term must match and results are
+    ranked by the summed token weights.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        from api.models import ProductSearchToken
+
+        terms = parse_query(request.query_params.get(self.search_param, ''))
+        if not terms:
+            return queryset
+
+        any_term = Q()
+        any_term_joined = Q()
+        term_hits = {}
+        for number, (token, is_prefix) in enumerate(terms):
+            condition = term_filter(token, is_prefix)
+            any_term |= condition
+            any_term_joined |= term_filter(token, is_prefix, field='search_tokens__token')
+            term_hits[f'term_{number}'] = Count('pk', filter=condition)
+
+        # driven from the token index, only the index rows of the terms are
+        # read and products missing a term are dropped in the HAVING, the
+        # product table is only looked up by primary key
+        matching = ProductSearchToken.objects.filter(any_term).values('product_id').annotate(
+            **term_hits).filter(**{f'{name}__gt': 0 for name in term_hits}).values('product_id')
+        return queryset.filter(pk__in=matching).annotate(
+            search_rank=Sum('search_tokens__weight', filter=any_term_joined),
+        ).order_by('-search_rank', '-created_at')
@@ -0,0 +1,49 @@
+import threading
+
+from django.conf import settings
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+from django.views.decorators.csrf import csrf_exempt
+
+
+class LazyAdminURLConf:
+    """
+    Admin urlpatterns built on the first request under /admin/, admin
+    autodiscover (every admin.py and the admin views) runs then instead of
+    at startup.
+    """
+
+    @cached_property
+    def urlpatterns(self):
+        from django.contrib import admin
+
+        admin.autodiscover()
+        return admin.site.get_urls()
+
+
+def admin_urls():
+    from django.contrib import admin
+
+    if not settings.LAZY_STARTUP:
+        return admin.site.urls
+    return LazyAdminURLConf(), 'admin', admin.site.name
+
+
+def lazy_view(view_path, **initkwargs):
+    """
+    A view that imports the class based view at `view_path` on its first
+    request, for rarely used views with expensive imports (the API docs).
+    """
+    view = None
+    lock = threading.Lock()
+
+    @csrf_exempt
+    def load_and_dispatch(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            with lock:
+                if view is None:
+                    view = import_string(view_path).as_view(**initkwargs)
+        return view(request, *args, **kwargs)
+
+    return load_and_dispatch
@@ -4,7 +4,6 @@ from django.shortcuts import get_object_or_404
 from rest_framework import generics, status, mixins, views
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
-from django.core.mail import EmailMultiAlternatives
 from rest_framework_simplejwt.exceptions import InvalidToken
 
 from decouple import config
@@ -20,6 +19,8 @@ from api import serializers
 from api.serializers.auth import ChangePasswordSerializer
 from api.serializers.core import UserSerializer
 from api.utils.custom_status_code import HTTP_450_EMAIL_NOT_CONFIRMED
+from api.utils.mail import queue_email
+from api.utils.revocation import revoke_all_tokens, revoke_token
 
 
 class NoPatchPermission(BasePermission):
@@ -106,18 +107,12 @@ class ForgotPasswordView(generics.CreateAPIView):
 
         if user:
             # html_body = get_template('login/template_confirm_email.html').render({'confirmation_email': link, 'base_url': base_url})
-            try:
-                msg = EmailMultiAlternatives(
-                    'Password Reset OTP Code',
-                    f'OTP code use it to confirm your email: {user.generate_otp()}',
-                    config('EMAIL_HOST_USER'),
-                    [email]
-                )
-                # msg.attach_alternative(html_body, "text/html")
-                msg.send()
-                return Response({'detail': 'If an account with this email exists, a password reset email has been sent.'}, status=status.HTTP_200_OK)
-            except ConnectionRefusedError as e:
-                return Response({'detail': 'An error accurred while tring to send email'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            queue_email(
+                'Password Reset OTP Code',
+                f'OTP code use it to confirm your email: {user.generate_otp()}',
+                [email],
+                from_email=config('EMAIL_HOST_USER'),
+            )
         return Response({'detail': 'If an account with this email exists, a password reset email has been sent.'}, status=status.HTTP_200_OK)
 
 
@@ -200,19 +195,13 @@ class SendConfirmEmailView(generics.CreateAPIView):
 
         if user:
             # html_body = get_template('login/template_confirm_email.html').render({'confirmation_email': link, 'base_url': base_url})
-            try:
-                msg = EmailMultiAlternatives(
-                    'Confirm Your Email Code',
-                    f'OTP code use it to confirm your email: {user.generate_otp()}',
-                    config('EMAIL_HOST_USER'),
-                    [email]
-                )
-                # msg.attach_alternative(html_body, "text/html")
-                msg.send()
-                return Response({'detail': 'If an account with this email exists, a confirmation email has been sent.'}, status=status.HTTP_200_OK)
-            except ConnectionRefusedError as e:
-                return Response({'detail': 'An error accurred while tring to send email'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        return Response({'detail': 'If an account with this email exists, a confirmation  email has been sent.'}, status=status.HTTP_200_OK)
+            queue_email(
+                'Confirm Your Email Code',
+                f'OTP code use it to confirm your email: {user.generate_otp()}',
+                [email],
+                from_email=config('EMAIL_HOST_USER'),
+            )
+        return Response({'detail': 'If an account with this email exists, a confirmation email has been sent.'}, status=status.HTTP_200_OK)
 
 
 @extend_schema(tags=['Auth'], responses=serializers.MessageSerializer)
@@ -238,3 +227,23 @@ class ChangePasswordView(generics.GenericAPIView):
         user.password = new_password
         user.save()
         return Response({'detail': 'Password changed'}, status=status.HTTP_200_OK)
+
+
+@extend_schema(tags=['Auth'], request=None, responses=serializers.MessageSerializer)
+class LogoutView(views.APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        revoke_token(request.auth, request.user.pk)
+        return Response({'detail': 'Logged out'}, status=status.HTTP_200_OK)
+
+
+@extend_schema(tags=['Auth'], request=None, responses=serializers.MessageSerializer)
+class LogoutAllView(views.APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        user = get_user_model().objects.get(pk=request.user.pk)
+        revoke_all_tokens(user)
+        revoke_token(request.auth, user.pk)
+        return Response({'detail': 'Logged out of all sessions'}, status=status.HTTP_200_OK)
@@ -1,14 +1,41 @@
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.views import View
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.parsers import MultiPartParser
 
-from rest_framework.viewsets import ModelViewSet
-from rest_framework import filters
-from drf_spectacular.utils import extend_schema
+from rest_framework.decorators import action
+from rest_framework.viewsets import GenericViewSet, ModelViewSet
+from rest_framework import filters, mixins, status, views
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 from api import serializers, models
+from api.utils import flash_sales
+from api.utils.archive import restore_products, visible_archived_products
+from api.utils.barter import find_matches
+from api.utils.caching import REFERENCE_CACHES, CachedReferenceMixin, category_cache, location_cache
+from api.utils.chat import send_message, start_conversation
+from api.utils.compression import choose_encoding
+from api.utils.conditional import ConditionalGetMixin
+from api.utils.engagement import hot_products, record_contact, record_view
+from api.utils.export import EXPORT_FORMATS, ExportContentNegotiation, export_filename, iter_export
+from api.utils.facets import build_cube, cube_filters, filter_cube, get_catalog_cube, summarize
+from api.utils.fieldsets import SparseFieldsetMixin
+from api.utils.notifications import (
+	MAX_POLL_RESULTS, get_long_poll_timeout, get_poll_retry_after, get_unread_count, mark_read, wait_for_notifications,
+)
+from api.utils.pagination import KeysetPagination
+from api.utils.product_import import guess_format, import_products, iter_rows, text_stream
+from api.utils.schema import get_schema_artifact
+from api.utils.search import ProductSearchFilter
 
 
 @extend_schema(tags=['User'])
-class UserViewSet(ModelViewSet):
+class UserViewSet(SparseFieldsetMixin, ConditionalGetMixin, ModelViewSet):
 	queryset = models.User.objects.filter(is_active=True, is_suspended=False)
 	filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
 	search_fields = ['name']
@@ -32,27 +59,328 @@ class UserViewSet(ModelViewSet):
 		return [permission_class() for permission_class in self.permission_classes]
 
 	def get_parsers(self):
-		self.parser_classes.append(MultiPartParser)
-		return [parser_class() for parser_class in self.parser_classes]
+		return [parser_class() for parser_class in [*self.parser_classes, MultiPartParser]]
 
 
 @extend_schema(tags=['Product'])
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(SparseFieldsetMixin, ConditionalGetMixin, ModelViewSet):
 	queryset = models.Product.objects.filter(is_active=True)
+	# search results also depend on category names and location states
+	version_names = ['product', 'category', 'location']
 	serializer_class = serializers.ProductSerializer
-	filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
-	search_fields = ['name']
+	filter_backends = [ProductSearchFilter, filters.OrderingFilter, DjangoFilterBackend]
 	ordering_fields = ['name', 'created_at', 'price']
 	filterset_fields = ['product_type', 'category', 'location', 'user', 'exchange']
  
 	def get_parsers(self):
-		self.parser_classes.append(MultiPartParser)
-		return [parser_class() for parser_class in self.parser_classes]
+		return [parser_class() for parser_class in [*self.parser_classes, MultiPartParser]]
+
+	@extend_schema(
+		parameters=[OpenApiParameter('include_archived', bool, description='Also look in your archived products, admins in all')],
+		responses=serializers.ProductSerializer,
+	)
+	def retrieve(self, request, *args, **kwargs):
+		try:
+			response = super().retrieve(request, *args, **kwargs)
+		except Http404:
+			if request.query_params.get('include_archived') not in ('1', 'true'):
+				raise
+			pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+			archived = visible_archived_products(request.user).filter(pk=pk).first()
+			if archived is None:
+				raise
+			return Response(serializers.ArchivedProductSerializer(archived, context=self.get_serializer_context()).data)
+		if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+			# buffered in process and written in batches, not on the request path
+			record_view(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+		return response
+
+	@extend_schema(
+		parameters=[
+			OpenApiParameter('category', int),
+			OpenApiParameter('location', int),
+			OpenApiParameter('limit', int, description='At most 100'),
+		],
+		responses=serializers.HotProductSerializer(many=True),
+	)
+	@action(detail=False, methods=['get'])
+	def hot(self, request):
+		try:
+			params = {
+				name: int(request.query_params[name]) if request.query_params.get(name) else None
+				for name in ('category', 'location')
+			}
+			limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+		except ValueError:
+			return Response({'detail': 'category, location and limit must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+
+		products = hot_products(limit=limit, **params)
+		return Response(serializers.HotProductSerializer(products, many=True, context=self.get_serializer_context()).data)
+
+	@extend_schema(request=serializers.ProductImportRequestSerializer, responses=serializers.ProductImportResultSerializer)
+	@action(detail=False, methods=['post'], url_path='import', url_name='import')
+	def bulk_import(self, request):
+		request_serializer = serializers.ProductImportRequestSerializer(data=request.data)
+		request_serializer.is_valid(raise_exception=True)
+		upload = request_serializer.validated_data['file']
+		file_format = request_serializer.validated_data.get('format') or guess_format(upload.name)
+
+		rows = iter_rows(text_stream(upload.file), file_format)
+		result = import_products(rows, request.user.pk)
+		return Response(result.as_dict(), status=status.HTTP_200_OK)
+
+	@extend_schema(
+		parameters=[
+			OpenApiParameter('export_format', str, enum=list(EXPORT_FORMATS), description='csv (default) or jsonl'),
+			OpenApiParameter('compress', str, enum=['gzip']),
+		],
+		responses={(200, 'text/csv'): OpenApiTypes.STR, (200, 'application/x-ndjson'): OpenApiTypes.STR},
+	)
+	@action(detail=False, methods=['get'], content_negotiation_class=ExportContentNegotiation)
+	def export(self, request):
+		file_format = request.query_params.get('export_format', 'csv')
+		if file_format not in EXPORT_FORMATS:
+			return Response({'detail': 'export_format must be csv or jsonl'}, status=status.HTTP_400_BAD_REQUEST)
+		compress = request.query_params.get('compress') == 'gzip'
+
+		queryset = self.filter_queryset(self.get_queryset())
+		response = StreamingHttpResponse(
+			iter_export(queryset, file_format=file_format, compress=compress),
+			content_type='application/gzip' if compress else EXPORT_FORMATS[file_format],
+		)
+		response['Content-Disposition'] = f'attachment; filename="{export_filename("products", file_format, compress)}"'
+		return response
+
+
+	@extend_schema(responses=serializers.ProductFacetsSerializer)
+	@action(detail=False, methods=['get'])
+	def facets(self, request):
+		# also validates the filter params
+		queryset = self.filter_queryset(self.get_queryset())
+		filters = cube_filters(request.query_params)
+		if filters is None:
+			cube = build_cube(queryset)
+		else:
+			cube = filter_cube(get_catalog_cube(), filters)
+		return Response(summarize(cube))
+
+	@extend_schema(
+		parameters=[
+			OpenApiParameter('limit', int, description='Matches per kind, at most 50'),
+			OpenApiParameter('cycles', bool, description='Also look for three-way trades'),
+		],
+		responses=serializers.BarterMatchesSerializer,
+	)
+	@action(detail=True, methods=['get'])
+	def matches(self, request, pk=None):
+		product = self.get_object()
+		try:
+			limit = int(request.query_params.get('limit', 20))
+		except ValueError:
+			return Response({'detail': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+		cycles = request.query_params.get('cycles') in ('1', 'true')
+
+		matches = find_matches(product, limit=max(limit, 1), cycles=cycles)
+		serializer = serializers.BarterMatchesSerializer(matches, context=self.get_serializer_context())
+		return Response(serializer.data)
+
+
+@extend_schema(tags=['Product'])
+class ArchivedProductViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, GenericViewSet):
+	"""
+	Products the `archive_products` command moved out of the live catalog,
+	the most recently archived first. Owners see their own, admins all of
+	them.
+	"""
+	serializer_class = serializers.ArchivedProductSerializer
+	pagination_class = KeysetPagination
+	filter_backends = [DjangoFilterBackend]
+	filterset_fields = ['product_type', 'category', 'location', 'user']
+
+	def get_queryset(self):
+		return visible_archived_products(self.request.user).order_by('-archived_at')
+
+	@extend_schema(request=None, responses=serializers.ProductSerializer)
+	@action(detail=True, methods=['post'])
+	def restore(self, request, pk=None):
+		archived = self.get_object()
+		products = restore_products([archived.pk])
+		if not products:
+			return Response({'detail': 'Product already restored'}, status=status.HTTP_409_CONFLICT)
+		return Response(serializers.ProductSerializer(products[0], context=self.get_serializer_context()).data)
+
+
+@extend_schema(tags=['Flash sale'])
+class FlashSaleViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, GenericViewSet):
+	queryset = models.FlashSale.objects.all()
+	serializer_class = serializers.FlashSaleSerializer
+	pagination_class = None
+	lookup_value_regex = '[0-9]+'
+
+	@extend_schema(responses=serializers.FlashSaleListingSerializer(many=True))
+	def list(self, request, *args, **kwargs):
+		# running and upcoming sales, the stock shown may lag by FLASH_SALE_SNAPSHOT_TTL seconds
+		return Response(flash_sales.get_sale_listing())
+
+	@extend_schema(request=serializers.StockReservationRequestSerializer, responses=serializers.StockReservationSerializer)
+	@action(detail=True, methods=['post'])
+	def reserve(self, request, pk=None):
+		request_serializer = serializers.StockReservationRequestSerializer(data=request.data)
+		request_serializer.is_valid(raise_exception=True)
+		try:
+			reservation = flash_sales.reserve(int(pk), request.user.pk, request_serializer.validated_data['quantity'])
+		except flash_sales.SaleUnavailable:
+			if not models.FlashSale.objects.filter(pk=pk).exists():
+				return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+			return Response({'detail': 'Sold out or not on sale'}, status=status.HTTP_409_CONFLICT)
+		except flash_sales.AlreadyReserved:
+			return Response({'detail': 'You already hold a reservation for this sale'}, status=status.HTTP_409_CONFLICT)
+		return Response(serializers.StockReservationSerializer(reservation).data, status=status.HTTP_201_CREATED)
+
+
+@extend_schema(tags=['Flash sale'])
+class StockReservationViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, GenericViewSet):
+	serializer_class = serializers.StockReservationSerializer
+	pagination_class = KeysetPagination
 
+	def get_queryset(self):
+		return models.StockReservation.objects.filter(user_id=self.request.user.pk).order_by('-id')
+
+	@extend_schema(request=None, responses=serializers.StockReservationSerializer)
+	@action(detail=True, methods=['post'])
+	def confirm(self, request, pk=None):
+		reservation = self.get_object()
+		if not flash_sales.confirm(reservation.pk, request.user.pk):
+			return Response({'detail': 'Reservation expired or already closed'}, status=status.HTTP_409_CONFLICT)
+		reservation.refresh_from_db()
+		return Response(self.get_serializer(reservation).data)
+
+	@extend_schema(request=None, responses=serializers.StockReservationSerializer)
+	@action(detail=True, methods=['post'])
+	def release(self, request, pk=None):
+		reservation = self.get_object()
+		if not flash_sales.release([reservation.pk]):
+			return Response({'detail': 'Reservation already closed'}, status=status.HTTP_409_CONFLICT)
+		reservation.refresh_from_db()
+		return Response(self.get_serializer(reservation).data)
+
+
+@extend_schema(tags=['Chat'])
+class ConversationViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, GenericViewSet):
+	"""
+	Conversations about a product between its owner and one buyer, the most
+	recently active first. New messages are also pushed over the `/ws/chat/`
+	websocket of the ASGI app.
+	"""
+	serializer_class = serializers.ConversationSerializer
+	pagination_class = KeysetPagination
+
+	def get_queryset(self):
+		user_id = self.request.user.pk
+		return models.Conversation.objects.filter(Q(buyer_id=user_id) | Q(seller_id=user_id)).order_by('-last_message_at')
+
+	def create(self, request, *args, **kwargs):
+		serializer = self.get_serializer(data=request.data)
+		serializer.is_valid(raise_exception=True)
+		conversation, created = start_conversation(serializer.validated_data['product'], request.user.pk)
+		if created:
+			record_contact(conversation.product_id)
+		return Response(
+			self.get_serializer(conversation).data,
+			status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+		)
+
+	@extend_schema(methods=['GET'], responses=serializers.MessageSerializer(many=True))
+	@extend_schema(methods=['POST'], request=serializers.MessageSerializer, responses=serializers.MessageSerializer)
+	@action(detail=True, methods=['get', 'post'], serializer_class=serializers.MessageSerializer)
+	def messages(self, request, pk=None):
+		conversation = self.get_object()
+		if request.method == 'POST':
+			serializer = serializers.MessageSerializer(data=request.data)
+			serializer.is_valid(raise_exception=True)
+			message = send_message(conversation, request.user.pk, serializer.validated_data['body'])
+			return Response(serializers.MessageSerializer(message).data, status=status.HTTP_201_CREATED)
+
+		# newest first, older pages through the cursor
+		page = self.paginate_queryset(conversation.messages.order_by('-id'))
+		return self.get_paginated_response(serializers.MessageSerializer(page, many=True).data)
+
+
+@extend_schema(tags=['Notification'])
+class NotificationViewSet(mixins.ListModelMixin, GenericViewSet):
+	"""
+	The user's notifications, newest first in keyset pages. Clients keep up
+	with `poll`, which only returns what is newer than their cursor and can
+	wait for it instead of being called again and again.
+	"""
+	serializer_class = serializers.NotificationSerializer
+	pagination_class = KeysetPagination
+
+	def get_queryset(self):
+		queryset = models.Notification.objects.filter(user_id=self.request.user.pk).order_by('-id')
+		if self.request.query_params.get('unread') in ('1', 'true'):
+			queryset = queryset.filter(read_at__isnull=True)
+		return queryset
+
+	@extend_schema(parameters=[OpenApiParameter('unread', bool, description='Only unread notifications')])
+	def list(self, request, *args, **kwargs):
+		return super().list(request, *args, **kwargs)
+
+	@extend_schema(
+		parameters=[
+			OpenApiParameter('after', int, description='Cursor from the previous poll, 0 the first time'),
+			OpenApiParameter('wait', int, description=(
+				'Seconds to wait for a new notification when there is none, at most 25 on the ASGI app '
+				'and 5 on WSGI workers. Without a shared cache the poll does not wait and sets `retry_after`')),
+		],
+		responses=serializers.NotificationPollSerializer,
+	)
+	@action(detail=False, methods=['get'])
+	def poll(self, request):
+		try:
+			after = int(request.query_params.get('after', 0))
+			wait = int(request.query_params.get('wait', 0))
+		except ValueError:
+			return Response({'detail': 'after and wait must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+		max_wait = get_long_poll_timeout(request._request)
+		# without a shared cache nothing can wake a waiting poll, the client polls again later
+		retry_after = get_poll_retry_after() if wait > 0 and not max_wait else 0
+		wait = min(max(wait, 0), max_wait)
+
+		queryset = models.Notification.objects.filter(user_id=request.user.pk, id__gt=after).order_by('id')
+		rows = list(queryset[:MAX_POLL_RESULTS + 1])
+		if not rows and wait:
+			# queried again even when the wait timed out, a wake up can be missed
+			wait_for_notifications(request.user.pk, after, wait)
+			rows = list(queryset[:MAX_POLL_RESULTS + 1])
+
+		has_more = len(rows) > MAX_POLL_RESULTS
+		rows = rows[:MAX_POLL_RESULTS]
+		serializer = serializers.NotificationPollSerializer({
+			'results': rows,
+			'cursor': rows[-1].pk if rows else after,
+			'has_more': has_more,
+			'unread': get_unread_count(request.user.pk),
+			'retry_after': retry_after,
+		})
+		response = Response(serializer.data)
+		if retry_after:
+			response['Retry-After'] = str(retry_after)
+		return response
+
+	@extend_schema(request=serializers.NotificationReadSerializer, responses=serializers.NotificationReadResultSerializer)
+	@action(detail=False, methods=['post'])
+	def read(self, request):
+		request_serializer = serializers.NotificationReadSerializer(data=request.data)
+		request_serializer.is_valid(raise_exception=True)
+		marked = mark_read(request.user.pk, request_serializer.validated_data.get('ids'))
+		return Response({'marked': marked, 'unread': get_unread_count(request.user.pk)})
 
 
 @extend_schema(tags=['Location'])
-class LocationViewSet(ModelViewSet):
+class LocationViewSet(ConditionalGetMixin, CachedReferenceMixin, ModelViewSet):
+	reference_cache = location_cache
+	conditional_retrieve_from_table = True
 	queryset = models.Location.objects.all()
 	serializer_class = serializers.LocationSerializer
 	filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -62,10 +390,49 @@ class LocationViewSet(ModelViewSet):
 
 
 @extend_schema(tags=['Category'])
-class CategoryViewSet(ModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, CachedReferenceMixin, ModelViewSet):
+	reference_cache = category_cache
+	conditional_retrieve_from_table = True
 	queryset = models.Category.objects.all()
 	serializer_class = serializers.CategorySerializer
 	filter_backends = [filters.SearchFilter, filters.OrderingFilter]
 	search_fields = ['name']
 	ordering_fields = ['name', 'created_at']
 
+
+@extend_schema(tags=['Cache'], responses=serializers.CacheStatsSerializer(many=True))
+class CacheStatsView(views.APIView):
+	permission_classes = [IsAdminUser]
+
+	def get(self, request):
+		return Response([reference_cache.stats() for reference_cache in REFERENCE_CACHES])
+
+
+class SchemaView(View):
+	"""
+	Serves the schema written by `manage.py build_schema` from memory, only
+	DEBUG falls back to generating it on the request.
+	"""
+
+	def get(self, request, *args, **kwargs):
+		artifact = get_schema_artifact()
+		if artifact is None:
+			if settings.DEBUG:
+				from drf_spectacular.views import SpectacularAPIView
+				from api.utils import openapi  # noqa: F401
+
+				return SpectacularAPIView.as_view()(request, *args, **kwargs)
+			return HttpResponse(
+				b'{"detail":"The API schema has not been built, run manage.py build_schema"}',
+				status=status.HTTP_503_SERVICE_UNAVAILABLE, content_type='application/json')
+
+		response = get_conditional_response(request, etag=artifact.etag)
+		if response is None:
+			coding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+			response = HttpResponse(artifact.get_content(coding), content_type='application/vnd.oai.openapi+json')
+			if coding:
+				response['Content-Encoding'] = coding
+		response['ETag'] = artifact.etag
+		patch_vary_headers(response, ('Accept-Encoding',))
+		patch_cache_control(response, public=True, max_age=300)
+		return response
@@ -32,6 +32,12 @@ TRY_LOCAL_DB = bool(int(config('TRY_LOCAL_DB', 0)))
 TRY_LOCAL_STORAGE = bool(int(config('TRY_LOCAL_STORAGE', 0)))
 TRY_LOCAL_EMAIL = bool(int(config('TRY_LOCAL_EMAIL', 0)))
 
+# serverless cold start mode, rarely used apps are loaded on first use
+LAZY_STARTUP = bool(int(config('LAZY_STARTUP', 0)))
+
+# a second sqlite file standing in for a read replica, fill it with `manage.py sync_local_replica`
+TRY_LOCAL_REPLICA = bool(int(config('TRY_LOCAL_REPLICA', 0)))
+
 ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
 
 _ALLOWED_HOST = config('ALLOWED_HOST')
@@ -41,7 +47,8 @@ if _ALLOWED_HOST:
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    # SimpleAdminConfig skips admin autodiscover, see api.utils.startup.admin_urls
+    'django.contrib.admin.apps.SimpleAdminConfig' if LAZY_STARTUP else 'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -58,6 +65,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.utils.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,17 +78,21 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.utils.perms_and_auth.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'api.utils.perms_and_auth.MyValidUser',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.utils.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.FormParser',
-        'rest_framework.parsers.JSONParser',
+        'api.utils.renderers.FastJSONParser',
     ],
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.utils.pagination.HybridPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_ORDERING': ('created_at',),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
@@ -124,8 +136,11 @@ TEMPLATES = [
 WSGI_APPLICATION = 'naija_barter.wsgi.application'
 
 if not TRY_LOCAL_STORAGE:
-    INSTALLED_APPS.append('cloudinary')
-    INSTALLED_APPS.append('cloudinary_storage')
+    # the storage works without the apps (they add template tags and commands), so
+    # cloudinary is then only imported on the first media access
+    if not LAZY_STARTUP:
+        INSTALLED_APPS.append('cloudinary')
+        INSTALLED_APPS.append('cloudinary_storage')
 
     DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
@@ -158,6 +173,98 @@ else:
         }
     }
 
+DATABASES['default'].update({
+    'CONN_MAX_AGE': int(config('DATABASES_DEFAULT_CONN_MAX_AGE', 0)),
+    'CONN_HEALTH_CHECKS': bool(int(config('DATABASES_DEFAULT_CONN_HEALTH_CHECKS', 0))),
+})
+
+# read replicas, safe-method requests read from them, see api/utils/db_routing.py
+if TRY_LOCAL_DB:
+    _REPLICAS = [{**DATABASES['default'], 'NAME': BASE_DIR / 'db.replica.sqlite3'}] if TRY_LOCAL_REPLICA else []
+else:
+    # same name and credentials as the primary, only the host differs
+    _REPLICAS = [
+        {**DATABASES['default'], 'HOST': host}
+        for host in config('DATABASES_REPLICA_HOSTS', '').split(',') if host.strip()
+    ]
+
+for _number, _replica in enumerate(_REPLICAS, 1):
+    _replica.update({
+        'CONN_MAX_AGE': int(config('DATABASES_REPLICA_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': bool(int(config('DATABASES_REPLICA_CONN_HEALTH_CHECKS', 1))),
+        # tests run against the primary only
+        'TEST': {'MIRROR': 'default'},
+    })
+    DATABASES[f'replica{_number}'] = _replica
+
+DATABASE_REPLICAS = [f'replica{_number}' for _number in range(1, len(_REPLICAS) + 1)]
+# how long a client or user that wrote keeps reading from the primary
+REPLICA_PIN_SECONDS = 5
+
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['api.utils.db_routing.ReplicaRouter']
+    MIDDLEWARE.insert(MIDDLEWARE.index('corsheaders.middleware.CorsMiddleware'), 'api.utils.db_routing.ReplicaRoutingMiddleware')
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', ''),
+    }
+}
+
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+REFERENCE_CACHE_LOCAL_MAX_ENTRIES = 256  # per cache and process, the least recently used go first
+
+USER_STATUS_CACHE_TIMEOUT = 60 * 60
+USER_STATUS_LOCAL_CACHE_TIMEOUT = 5  # used instead when the cache is per process, see api/utils/perms_and_auth.py
+# in-process bloom filter of revoked token ids, rebuilt larger when it fills up
+REVOCATION_FILTER_CAPACITY = 10000
+REVOCATION_FILTER_ERROR_RATE = 0.01
+REVOCATION_FILTER_SYNC_INTERVAL = 5  # seconds, bounds how late a revocation is seen without a shared cache
+FACET_CACHE_TIMEOUT = 60 * 10  # the cube is also dropped whenever a product changes cell
+
+# notifications, see api/utils/notifications.py
+NOTIFICATION_BATCH_SIZE = 500
+NOTIFICATION_JOB_BATCH_SIZE = 100  # queued fan-out jobs per batch of `send_queued_notifications`
+NOTIFICATION_JOB_CLAIM_TIMEOUT = 60 * 5  # seconds before jobs claimed by a dead worker run again
+NOTIFICATION_JOB_MAX_ATTEMPTS = 3
+NOTIFICATION_LONG_POLL_TIMEOUT = 25  # upper bound for ?wait= on the ASGI app, keep it under the proxy timeout
+NOTIFICATION_LONG_POLL_WSGI_TIMEOUT = 5  # on WSGI, each waiting poll holds a whole worker
+NOTIFICATION_POLL_INTERVAL = 1  # seconds between cache checks while a long-poll waits
+NOTIFICATION_POLL_RETRY_AFTER = 10  # suggested poll interval when the cache is per process and polls cannot wait
+
+# view and contact counters and hot deals, see api/utils/engagement.py
+# seconds between batched counter writes, short on serverless hosts where an idle process may be dropped
+ENGAGEMENT_FLUSH_INTERVAL = 1 if LAZY_STARTUP else 10
+ENGAGEMENT_BUFFER_MAX_KEYS = 10000  # flush early when this many products are pending
+TRENDING_HALF_LIFE = 60 * 60 * 24  # seconds for a view to lose half of its weight
+TRENDING_WEIGHTS = {'views': 1, 'contacts': 5}
+HOT_DEALS_RANKING_SIZE = 1000  # ranked products kept in the cache, filters pick from these
+HOT_DEALS_CACHE_TIMEOUT = 60 * 60  # the trending job rewrites the ranking more often than this
+
+# archiving old products out of the live table, see api/utils/archive.py
+PRODUCT_ARCHIVE_INACTIVE_DAYS = 30  # inactive products not updated for this long are archived
+PRODUCT_ARCHIVE_MAX_AGE_DAYS = 365  # any product not updated for this long, None keeps active ones
+PRODUCT_ARCHIVE_BATCH_SIZE = 500  # products moved per transaction
+
+# flash sales, see api/utils/flash_sales.py
+FLASH_SALE_RESERVATION_TTL = 60 * 10  # seconds a reservation holds stock before it is released
+FLASH_SALE_MAX_QUANTITY = 5  # per reservation
+FLASH_SALE_SNAPSHOT_TTL = 2  # seconds the sale listing (and the stock it shows) may lag behind
+
+# chat delivery, the in-memory layer only reaches sockets served by the same process
+CHAT_CHANNEL_LAYER = config('CHAT_CHANNEL_LAYER', 'api.utils.chat.InMemoryChannelLayer')
+CHAT_QUEUE_SIZE = 100  # undelivered events per socket before the client is told to resync
+
+# response compression, see api/utils/compression.py
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 4
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -205,6 +312,12 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# product/user image renditions, see api/utils/images.py. Under LAZY_STARTUP the worker threads may
+# never run, schedule `manage.py generate_image_renditions --missing-only` to backfill them
+IMAGE_RENDITION_STORAGE = None  # dotted path of a storage class, defaults to the default storage
+IMAGE_PIPELINE_WORKERS = 2
+IMAGE_PIPELINE_SYNC = False
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -227,6 +340,14 @@ else:
     EMAIL_PORT = config('EMAIL_PORT', '587')
     EMAIL_USE_TLS = bool(config('EMAIL_USE_TLS', True))
 
+# outbox worker, see `manage.py send_queued_email`
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 30  # seconds, doubled on every attempt
+EMAIL_OUTBOX_MAX_RETRY_DELAY = 60 * 60
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 60 * 10  # seconds before emails claimed by a dead worker are sent again
+EMAIL_OUTBOX_RETENTION_DAYS = 7  # sent and failed emails are purged after this
+
 
 CORS_ALLOW_CREDENTIALS = True
 
@@ -14,14 +14,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from api import views
+from api.utils.startup import admin_urls
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    path('admin/', admin_urls()),
     path('api/v1/', include('api.urls')),
     path('', views.MyRedirectView.as_view(), name='redirect_to_api_docs')
 ]